@@ -0,0 +1,95 @@
+"""Allocation and serialization cost of the per-turn Base objects.
+
+Compares Dialog, with __slots__ and the accessors precompiled by Base, to
+a replica of the former __dict__-based Dialog serialized by a getattr loop.
+
+    python benchmarks/bench_base_values.py
+"""
+
+import os
+import sys
+import uuid
+import timeit
+import logging
+import tracemalloc
+
+# run from a checkout, without installing topicbot
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from topicbot.base import Base
+from topicbot.context import Context
+from topicbot.dialog import Dialog
+from topicbot.grounding import Grounding
+from topicbot.storage import InMemoryStorage
+
+
+NUMBER = 100000
+MSG = {"user": "user-0001", "customer": "common", "text": "hello"}
+
+
+class _LegacyDialog:
+
+    _attrs = ["id", "msg", "parsed_data", "response"]
+
+    def __init__(self, msg: dict, context, grounding):
+        self._id = str(uuid.uuid1())
+        self._msg = msg
+        self._context = context
+        self._grounding = grounding
+        self._response = None
+        self._parsed_data = {}
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def msg(self):
+        return self._msg
+
+    @property
+    def parsed_data(self):
+        return self._parsed_data
+
+    @property
+    def response(self):
+        return self._response
+
+    @property
+    def values(self) -> dict:
+        values = dict()
+        for attr in self._attrs:
+            value = getattr(self, attr)
+            if type(value).__repr__ is object.__repr__:
+                logging.error("%s.__repr__() is not implemented!" %
+                              value.__class__.__name__)
+                continue
+            values[attr] = value
+        return values
+
+
+def _allocated(factory, number: int=1000) -> float:
+    tracemalloc.start()
+    objects = [factory() for _ in range(number)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / number
+
+
+def main():
+    Base._storage = InMemoryStorage()
+    context, grounding = Context(), Grounding()
+    for cls in (_LegacyDialog, Dialog):
+        dialog = cls(MSG, context, grounding)
+        create = timeit.timeit(lambda: cls(MSG, context, grounding),
+                               number=NUMBER)
+        values = timeit.timeit(lambda: dialog.values, number=NUMBER)
+        print("%-14s create %5.2fus  values %5.2fus  %4.0f bytes per instance"
+              % (cls.__name__, create / NUMBER * 1e6, values / NUMBER * 1e6,
+                 _allocated(lambda: cls(MSG, context, grounding))))
+
+
+if __name__ == "__main__":
+    main()
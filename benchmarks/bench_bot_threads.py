@@ -0,0 +1,60 @@
+"""Throughput of Bot.respond with growing number of threads.
+
+The Client is replaced by a stub which spends WORK seconds in GIL-releasing
+calls, standing in for the NER/intent models and the storage round trips.
+Running with one lock stripe reproduces a single global lock.
+
+    python benchmarks/bench_bot_threads.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+# run from a checkout, without installing topicbot, with the stub client of
+# the tests
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _root)
+sys.path.insert(0, os.path.join(_root, "tests"))
+
+import topicbot.bot
+
+from topicbot.bot import Bot
+from conftest import StubClient
+
+
+WORK = 0.002
+TURNS = 2000
+USERS = 500
+
+
+def _run(bot: Bot, threads: int) -> float:
+    msgs = [{"user": "user%d" % (i % USERS), "text": ""} for i in range(TURNS)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(bot.respond, msgs))
+    return TURNS / (time.perf_counter() - start)
+
+
+def main():
+    StubClient.work = WORK
+    topicbot.bot.Client = StubClient
+    with tempfile.NamedTemporaryFile("w", suffix=".cfg", delete=False) as f:
+        f.write("[Bot]\nmax_clients_num = %d\n" % USERS)
+    try:
+        for stripes in (1, 32):
+            Bot._lock_stripes = stripes
+            bot = Bot(configs_path=f.name, ner=None,
+                      intent_classifiers={"common": None})
+            for threads in (1, 2, 4, 8, 16):
+                print("stripes=%-3d threads=%-3d %8.0f turns/s" %
+                      (stripes, threads, _run(bot, threads)))
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Encode/decode time and payload size of the storage codecs.
+
+The value mimics Client.values of a user with some conversation history.
+
+    python benchmarks/bench_codecs.py
+"""
+
+import os
+import sys
+import timeit
+
+from collections import OrderedDict
+
+# run from a checkout, without installing topicbot
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from topicbot.codecs import JSONCodec, BinaryCodec
+
+
+NUMBER = 2000
+
+
+class _Values:
+
+    def __init__(self, data: dict):
+        self.values = data
+
+
+def _session(turns: int) -> dict:
+    return {
+        "id": "user-0001",
+        "msg": {"user": "user-0001", "customer": "common", "text": "hello",
+                "platform": "web", "version": "1.2.3"},
+        "previous_topics": [
+            OrderedDict([("domain%d.intent%d.case" % (i % 7, i % 3),
+                          "domain%d.intent%d" % (i % 7, i % 3))])
+            for i in range(turns)],
+        "context": _Values({"turn": turns, "city": "Shanghai",
+                            "history": ["utterance %d" % i
+                                        for i in range(turns)]}),
+        "grounding": _Values({"name": "Alice", "vip": True, "score": 0.87}),
+        "topics_summary": {"turns": turns * 3,
+                           "topics": {"domain%d" % i: i for i in range(7)}}
+    }
+
+
+def main():
+    for turns in (5, 20, 100):
+        value = _session(turns)
+        for codec in (JSONCodec(), BinaryCodec(compress_threshold=0),
+                      BinaryCodec(compress_threshold=1024)):
+            data = codec.encode(value)
+            encode = timeit.timeit(lambda: codec.encode(value), number=NUMBER)
+            decode = timeit.timeit(lambda: codec.decode(data), number=NUMBER)
+            name = codec.__class__.__name__
+            if isinstance(codec, BinaryCodec):
+                name += "(compress=%d)" % codec._compress_threshold
+            print("turns=%-4d %-28s encode %6.1fus  decode %6.1fus  %6d bytes"
+                  % (turns, name, encode / NUMBER * 1e6,
+                     decode / NUMBER * 1e6, len(data)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Configs shared by the tests, loaded once as the configs of topicbot are"""
+
+import os
+import time
+import tempfile
+
+import pytest
+
+from topicbot.configs import configs
+
+
+_root = tempfile.mkdtemp(prefix="topicbot-tests-")
+os.makedirs(os.path.join(_root, "topics"))
+os.makedirs(os.path.join(_root, "responses"))
+
+# where the topic manifests are saved by default
+os.environ["XDG_CACHE_HOME"] = os.path.join(_root, "cache")
+
+CONFIGS_PATH = os.path.join(_root, "configs.cfg")
+with open(CONFIGS_PATH, "w") as f:
+    f.write("""[Root]
+root_path = {root}
+
+[Bot]
+silence_threhold = 180
+silence_threhold_variance = 0
+max_clients_num = 1024
+lock_stripes = 32
+
+[Base]
+storage = topicbot.storage.InMemoryStorage
+
+[Topics]
+topic_path = {root}/topics
+default_topic = default
+
+[Responses]
+response_path = {root}/responses
+delay_per_word = 0.1
+delay_ratio = 0.3
+delay_max = 5
+""".format(root=_root))
+
+configs.read(CONFIGS_PATH)
+
+
+@pytest.fixture
+def configs_path() -> str:
+    return CONFIGS_PATH
+
+
+@pytest.fixture
+def memory_storage():
+    from topicbot.storage import InMemoryStorage
+    storage = InMemoryStorage()
+    storage.clear()
+    yield storage
+    storage.clear()
+
+
+class StubClient:
+    """Client without models nor storage, for the Bot and AsyncBot tests and
+    the benchmarks. Each one sleeps work seconds when created, and records
+    the messages parsed by async_parse in turns."""
+
+    work = 0
+    turns = []
+
+    def __init__(self, msg: dict, ner, intent_classifier, cache=None,
+                 parse=True):
+        self.id = msg["user"]
+        self.msg = msg
+        if self.work:
+            time.sleep(self.work)
+
+    async def async_parse(self, executor=None):
+        StubClient.turns.append(self.msg)
+
+    def respond(self) -> list:
+        return []
+
+    def state(self) -> dict:
+        return {"user_id": self.id, "timestamp": int(time.time())}
+
+    def save(self):
+        pass
+
+    async def asave(self):
+        pass
+
+
+@pytest.fixture
+def stub_client():
+    StubClient.turns = []
+    yield StubClient
+    StubClient.turns = []
@@ -0,0 +1,20 @@
+import asyncio
+
+import topicbot.aio
+
+from topicbot.aio import AsyncBot
+
+
+def test_actively_respond_many_awaits_the_turns(monkeypatch, configs_path,
+                                                memory_storage, stub_client):
+    monkeypatch.setattr(topicbot.aio, "Client", stub_client)
+    memory_storage.add("u1", {"msg": {"user": "u1", "text": "hi"}})
+    memory_storage.add("u2", {"msg": {"user": "u2", "text": "hello"}})
+    bot = AsyncBot(configs_path=configs_path, ner=None,
+                   intent_classifiers={"common": None})
+
+    asyncio.run(bot.actively_respond_many(["u1", "u2", "unknown"]))
+
+    assert [msg["user"] for msg in stub_client.turns] == ["u1", "u2"]
+    assert all(msg["initiative"] and msg["text"] == ""
+               for msg in stub_client.turns)
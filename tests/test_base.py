@@ -0,0 +1,86 @@
+from topicbot.base import Base
+
+
+class _Record(Base):
+
+    __slots__ = ("_payload", "_loads")
+
+    _attrs = ["id", "payload"]
+
+    def __init__(self, id: str=None, cache: dict=None):
+        self._payload = None
+        self._loads = 0
+        super().__init__(id, cache)
+
+    @property
+    def payload(self) -> dict:
+        return self._payload
+
+    @payload.setter
+    def payload(self, payload: dict):
+        self._loads += 1
+        self._payload = payload
+
+
+class _EagerRecord(_Record):
+
+    _lazy_restore = False
+
+
+class _PartlyLazyRecord(_Record):
+
+    __slots__ = ("_extra",)
+
+    _attrs = ["id", "payload", "extra"]
+    _lazy_restore = ("extra",)
+
+    def __init__(self, id: str=None, cache: dict=None):
+        self._extra = None
+        super().__init__(id, cache)
+
+    @property
+    def extra(self) -> dict:
+        return self._extra
+
+    @extra.setter
+    def extra(self, extra: dict):
+        self._loads += 10
+        self._extra = extra
+
+
+def test_lazy_attrs_are_hydrated_on_first_access():
+    record = _Record("r1", cache={"id": "r1", "payload": {"a": 1}})
+    assert record._loads == 0
+    assert record.values == {"id": "r1", "payload": {"a": 1}}
+    assert record._loads == 0
+    assert record.payload == {"a": 1}
+    assert record._loads == 1
+
+
+def test_assignment_overrides_the_cached_data():
+    record = _Record("r1", cache={"id": "r1", "payload": {"a": 1}})
+    record.payload = {"b": 2}
+    assert record.values["payload"] == {"b": 2}
+
+
+def test_eager_restore_sets_attrs_at_once():
+    # the properties are inherited from the lazy _Record
+    assert _EagerRecord._lazy_attrs == frozenset()
+    record = _EagerRecord("r1", cache={"id": "r1", "payload": {"a": 1}})
+    assert record._loads == 1
+    assert record.values == {"id": "r1", "payload": {"a": 1}}
+    assert record.payload == {"a": 1}
+    assert record._loads == 1
+    # the parent stays lazy
+    assert _Record("r1", cache={"payload": {"a": 1}})._loads == 0
+
+
+def test_lazy_restore_of_named_attrs_only():
+    assert _PartlyLazyRecord._lazy_attrs == {"extra"}
+    record = _PartlyLazyRecord(
+        "r1", cache={"id": "r1", "payload": {"a": 1}, "extra": {"b": 2}})
+    assert record._loads == 1
+    assert record.values["extra"] == {"b": 2}
+    assert record._loads == 1
+    assert record.extra == {"b": 2}
+    assert record._loads == 11
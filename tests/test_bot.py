@@ -0,0 +1,42 @@
+import pytest
+
+import topicbot.bot
+
+from topicbot.bot import Bot
+
+
+@pytest.fixture
+def make_bot(monkeypatch, configs_path, stub_client):
+    monkeypatch.setattr(topicbot.bot, "Client", stub_client)
+
+    def make(max_clients_num: int, lock_stripes: int=32) -> Bot:
+        monkeypatch.setattr(Bot, "_max_clients_num", max_clients_num)
+        monkeypatch.setattr(Bot, "_lock_stripes", lock_stripes)
+        return Bot(configs_path=configs_path, ner=None,
+                   intent_classifiers={"common": None})
+    return make
+
+
+def test_no_eviction_below_the_cap(make_bot):
+    bot = make_bot(1024)
+    for i in range(1000):
+        bot.respond({"user": "user%d" % i})
+
+    stats = bot.clients_stats()
+    assert stats["clients"] == 1000
+    assert stats["evictions"] == 0
+
+
+def test_cap_is_global_and_evicts_the_least_recent(make_bot):
+    bot = make_bot(10, lock_stripes=32)
+    for i in range(100):
+        bot.respond({"user": "user%d" % i})
+        # keep user0 active
+        bot.respond({"user": "user0"})
+
+    stats = bot.clients_stats()
+    assert stats["clients"] == 10
+    assert stats["evictions"] == 90
+    tracked = {user for shard in bot._shards for user in shard.clients}
+    assert len(tracked) == 10
+    assert "user0" in tracked and "user99" in tracked
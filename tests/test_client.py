@@ -0,0 +1,88 @@
+from collections import OrderedDict
+
+import pytest
+
+from topicbot.client import Client
+
+
+class _Values:
+
+    def __init__(self, values: dict=None):
+        self.values = values or {}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Client, "_class_context", _Values)
+    monkeypatch.setattr(Client, "_class_grounding", _Values)
+    monkeypatch.setattr(Client, "_max_previous_topics", 3)
+    monkeypatch.setattr(Client, "_summarize_previous_topics", True)
+
+    def create(cache: dict=None) -> Client:
+        # without parsing a message, which needs the models and the topics
+        client = object.__new__(Client)
+        client._raw = None
+        client._id = "user-1"
+        client._previous_topics = None
+        client._topics_summary = None
+        client._context = None
+        client._grounding = None
+        if cache:
+            client._restore(cache)
+        if client.previous_topics is None:
+            client.previous_topics = []
+        return client
+
+    return create
+
+
+def _turn(*names: str) -> OrderedDict:
+    return OrderedDict((name + ".case", name) for name in names)
+
+
+def test_previous_topics_are_trimmed_into_the_summary(client):
+    client = client()
+    for names in (["a"], ["b"], ["a", "c"], ["a"], ["b"]):
+        client._update_previous_topics(_turn(*names))
+    assert client.previous_topics == [_turn("a", "c"), _turn("a"),
+                                      _turn("b")]
+    assert client.topics_summary == {"turns": 2, "topics": {"a": 1, "b": 1}}
+
+    client._update_previous_topics(OrderedDict())
+    assert len(client.previous_topics) == 3
+    client._update_previous_topics(_turn("c"))
+    assert client.topics_summary == \
+        {"turns": 3, "topics": {"a": 2, "b": 1, "c": 1}}
+
+
+def test_trimmed_topics_are_dropped_without_summary(client, monkeypatch):
+    monkeypatch.setattr(Client, "_summarize_previous_topics", False)
+    client = client()
+    for name in "abcde":
+        client._update_previous_topics(_turn(name))
+    assert client.previous_topics == [_turn("c"), _turn("d"), _turn("e")]
+    assert client.topics_summary is None
+
+
+def test_zero_keeps_all_previous_topics(client, monkeypatch):
+    monkeypatch.setattr(Client, "_max_previous_topics", 0)
+    client = client()
+    for i in range(50):
+        client._update_previous_topics(_turn("t%d" % i))
+    assert len(client.previous_topics) == 50
+    assert client.topics_summary is None
+
+
+def test_restored_summary_is_passed_through_until_trimmed(client):
+    summary = {"turns": 7, "topics": {"a": 7}}
+    client = client({"id": "user-1", "msg": {"text": "hi"},
+                     "previous_topics": [_turn("a")],
+                     "topics_summary": summary})
+    assert client._topics_summary is None
+    assert client.values["topics_summary"] is summary
+    assert client.values["msg"] == {"text": "hi"}
+
+    for name in "bcd":
+        client._update_previous_topics(_turn(name))
+    assert client.values["topics_summary"] == \
+        {"turns": 8, "topics": {"a": 8}}
@@ -0,0 +1,48 @@
+import json
+import marshal
+
+from collections import OrderedDict
+
+import pytest
+
+from topicbot.codecs import BinaryCodec, JSONCodec
+
+
+def test_binary_codec_round_trip():
+    codec = BinaryCodec(compress_threshold=16)
+    value = {"msg": {"text": "hello " * 10, "user": "u"}, "topics": [1, 2]}
+    data = codec.encode(value)
+    assert data[:3] == b"TB\x02"
+    assert data[4] == marshal.version
+    assert codec.decode(data) == value
+    assert codec.decode('{"json": 1}') == {"json": 1}
+
+
+def test_binary_codec_checks_the_marshal_version():
+    codec = BinaryCodec(compress_threshold=0)
+    payload = marshal.dumps({"a": 1})
+    # written before the marshal version was recorded
+    assert codec.decode(b"TB\x01\x00" + payload) == {"a": 1}
+    newer = bytes((marshal.version + 1,))
+    with pytest.raises(ValueError):
+        codec.decode(b"TB\x02\x00" + newer + payload)
+
+
+class _Values:
+
+    def __init__(self, values: dict):
+        self.values = values
+
+
+@pytest.mark.parametrize("format_", [BinaryCodec.FORMAT_MSGPACK,
+                                     BinaryCodec.FORMAT_MARSHAL])
+def test_binary_codec_converts_objects_like_json(format_):
+    if format_ == BinaryCodec.FORMAT_MSGPACK:
+        pytest.importorskip("msgpack")
+    codec = BinaryCodec(compress_threshold=0)
+    codec._format = format_
+    value = {"previous_topics": [OrderedDict([("a.b", "a")])],
+             "context": _Values({"turn": 2, "grounding": _Values({})}),
+             "path": ("x", 1), "plain": {"n": 1.5, "none": None}}
+    assert codec.decode(codec.encode(value)) == \
+        json.loads(JSONCodec().encode(value))
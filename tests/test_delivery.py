@@ -0,0 +1,63 @@
+import queue
+
+from topicbot.delivery import ResponseDispatcher
+from topicbot.scheduler import ResponseScheduler
+
+
+class _Response:
+
+    def __init__(self, user: str, platform: str=None):
+        self.user = user
+        self.msg_data = {"platform": platform} if platform else {}
+
+
+def test_due_responses_are_routed_to_their_sinks():
+    scheduler = ResponseScheduler()
+    dispatcher = ResponseDispatcher(scheduler)
+    batches = []
+    wechat = queue.Queue()
+    dispatcher.add_sink(batches.append)
+    dispatcher.add_sink(wechat, route="wechat")
+
+    routed = _Response("u1", platform="wechat")
+    default = _Response("u2", platform="web")
+    scheduler.push(routed, delay=0, now=100)
+    scheduler.push(default, delay=0, now=100)
+    scheduler.push(_Response("u3"), delay=10, now=100)
+
+    assert dispatcher.deliver_due(now=101) == 2
+    assert wechat.get_nowait() is routed
+    assert batches == [[default]]
+    stats = dispatcher.stats()
+    assert stats["delivered"] == 2 and stats["pending"] == 1
+    assert stats["lateness_max"] == 1
+
+
+def test_failing_sinks_are_counted_not_raised():
+    scheduler = ResponseScheduler()
+    dispatcher = ResponseDispatcher(scheduler)
+
+    def sink(batch):
+        raise RuntimeError("down")
+
+    dispatcher.add_sink(sink)
+    scheduler.push(_Response("u1"), now=100)
+    assert dispatcher.deliver_due(now=100) == 1
+    assert dispatcher.stats()["errors"] == 1
+
+    dispatcher.remove_sink(sink)
+    scheduler.push(_Response("u1"), now=100)
+    assert dispatcher.deliver_due(now=100) == 0
+    assert dispatcher.stats()["undeliverable"] == 1
+
+
+def test_the_delivery_thread_stops():
+    scheduler = ResponseScheduler()
+    dispatcher = ResponseDispatcher(scheduler)
+    delivered = queue.Queue()
+    dispatcher.add_sink(delivered)
+    dispatcher.start()
+    scheduler.push(_Response("u1"))
+    assert delivered.get(timeout=2).user == "u1"
+    dispatcher.stop(timeout=2)
+    assert dispatcher._thread is None
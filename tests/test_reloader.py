@@ -0,0 +1,55 @@
+import os
+import time
+import threading
+
+from topicbot.reloader import Reloader, reload_files, scan_files
+
+
+def _write(path: str, text: str, mtime_ns: int):
+    with open(path, "w") as f:
+        f.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        text = f.read()
+    if text == "broken":
+        raise SyntaxError(path)
+    return {name: path for name in text.split()}
+
+
+def test_only_changed_files_are_reloaded(tmp_path):
+    a, b = str(tmp_path / "a.py"), str(tmp_path / "b.py")
+    _write(a, "x y", 1000)
+    _write(b, "z", 1000)
+    (tmp_path / "c.txt").write_text("ignored")
+    os.mkdir(tmp_path / "d.py")
+    files = scan_files([str(tmp_path)])
+    assert list(files) == [a, b]
+    known = {path: (stamp, list(_load(path))) for path, stamp in files.items()}
+    assert reload_files(known, files, _load) is None
+
+    _write(a, "x", 2000)
+    os.remove(b)
+    changes = reload_files(known, scan_files([str(tmp_path)]), _load)
+    assert changes.loaded == {"x": a}
+    assert changes.stale == {"x", "y", "z"}
+    assert changes.changed == [a] and changes.removed == [b]
+    assert changes.files == {a: ([2000, 1], ["x"])}
+
+    _write(a, "broken", 3000)
+    changes = reload_files(changes.files, scan_files([str(tmp_path)]), _load)
+    assert changes.failed == {a}
+    assert changes.stale == set() and changes.files[a][1] == ["x"]
+
+
+def test_reloader_polls_until_stopped():
+    polled = threading.Event()
+    reloader = Reloader(polled.set, 0.01, "TestReloader").start()
+    assert polled.wait(2)
+    reloader.stop(2)
+    assert not reloader.running
+    polled.clear()
+    time.sleep(0.05)
+    assert not polled.is_set()
@@ -0,0 +1,82 @@
+from topicbot.scheduler import ResponseScheduler, SilenceTracker
+
+
+class _Response:
+
+    def __init__(self, user: str, text: str="", platform: str=None):
+        self.user = user
+        self.text = text
+        self.msg_data = {"platform": platform} if platform else {}
+
+
+def test_responses_pop_in_order_of_due_time():
+    scheduler = ResponseScheduler()
+    a, b, c = _Response("u1", "a"), _Response("u2", "b"), _Response("u1", "c")
+    scheduler.push(c, delay=3, now=100)
+    scheduler.push(a, delay=1, now=100)
+    scheduler.push(b, delay=2, now=100)
+    assert scheduler.next_due() == 101
+    assert scheduler.pop_due(now=100.5) == []
+    assert scheduler.pop_due(now=102) == [a, b]
+    assert scheduler.pop_due_items(now=200) == [(103, c)]
+    assert len(scheduler) == 0
+
+
+def test_cancel_drops_the_pending_responses_of_a_user():
+    scheduler = ResponseScheduler()
+    for i in range(3):
+        scheduler.push(_Response("u1"), delay=i, now=100)
+    kept = _Response("u2")
+    scheduler.push(kept, delay=1, now=100)
+    assert scheduler.cancel("u1") == 3
+    assert scheduler.cancel("u1") == 0
+    assert scheduler.next_due() == 101
+    assert scheduler.pop_due(now=200) == [kept]
+
+
+def test_wait_returns_when_a_response_falls_due():
+    import time
+    import threading
+    scheduler = ResponseScheduler()
+    scheduler.push(_Response("u1"), delay=0.05)
+    start = time.time()
+    scheduler.wait(5)
+    assert time.time() - start < 1
+    assert len(scheduler.pop_due()) == 1
+
+    # an earlier response wakes up the waiters
+    scheduler.push(_Response("u2"), delay=60)
+    threading.Timer(0.05, scheduler.push, (_Response("u3"),)).start()
+    start = time.time()
+    scheduler.wait(5)
+    assert time.time() - start < 1
+    assert [r.user for r in scheduler.pop_due()] == ["u3"]
+
+
+def test_silence_deadlines_are_popped_once():
+    tracker = SilenceTracker(threshold=10)
+    tracker.touch("u1", ts=100)
+    tracker.touch("u2", ts=105)
+    tracker.touch("u1", ts=108)     # outdates the first deadline
+    assert tracker.due(now=111) == []
+    assert tracker.due(now=116) == ["u2"]
+    assert "u1" in tracker and "u2" not in tracker
+    tracker.discard("u1")
+    assert tracker.due(now=1000) == []
+    assert len(tracker) == 0
+
+
+def test_silence_deadlines_are_jittered_once():
+    import random
+    random.seed(3)
+    tracker = SilenceTracker(threshold=100, variance=10)
+    for i in range(100):
+        tracker.touch("u%d" % i, ts=0)
+    deadlines = set(tracker._deadlines.values())
+    assert len(deadlines) > 1
+    assert all(50 < deadline < 150 for deadline in deadlines)
+    # every user is due once, at its own deadline
+    users = []
+    for now in range(50, 151):
+        users += tracker.due(now=now)
+    assert sorted(users) == sorted("u%d" % i for i in range(100))
@@ -0,0 +1,276 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from topicbot.codecs import JSONCodec
+from topicbot.storage import RedisStorage
+
+
+@pytest.fixture
+def fakeredis():
+    return pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def server(fakeredis):
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def storage(fakeredis, server) -> RedisStorage:
+    return RedisStorage(
+        redis_client=fakeredis.FakeRedis(server=server),
+        async_client=fakeredis.aioredis.FakeRedis(server=server),
+        redis_name="test:", ttl=60, codec=JSONCodec())
+
+
+def test_awaitable_operations_use_the_async_client(storage):
+    async def turn():
+        await storage.aadd("a", {"n": 1})
+        await storage.aadd_many({"b": {"n": 2}, "c": {"n": 3}}, ttl=0.5)
+        assert await storage.aget("a") == {"n": 1}
+        assert await storage.aget_many(["a", "b", "x"]) == \
+            {"a": {"n": 1}, "b": {"n": 2}}
+        await storage.adelete("a")
+        await storage.adelete_many(["b"])
+        with pytest.raises(KeyError):
+            await storage.aget("a")
+        assert await storage.aget_many(["a", "b", "c"]) == {"c": {"n": 3}}
+        await storage.aclose()
+
+    asyncio.run(turn())
+    # shared with the blocking client
+    assert storage.get("c") == {"n": 3}
+    assert 0 < storage._store.pttl("test:c") <= 500
+
+
+def test_bulk_operations_and_per_key_ttl(storage):
+    storage.add_many({"a": {"n": 1}, "b": {"n": 2}})
+    storage.add("c", {"n": 3}, ttl=1.5)
+    storage.add("d", {"n": 4}, ttl=5)
+    assert storage.get_many(["a", "b", "c", "x"]) == \
+        {"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}}
+    assert storage.get_many([]) == {}
+
+    store = storage._store
+    assert 59 <= store.ttl("test:a") <= 60
+    assert 0 < store.pttl("test:c") <= 1500
+    assert 0 < store.ttl("test:d") <= 5
+
+    storage.delete_many(["a", "c"])
+    assert "a" not in storage
+    assert storage.get_many(["a", "b", "c"]) == {"b": {"n": 2}}
+    with pytest.raises(KeyError):
+        storage.get("c")
+
+
+def test_clear_only_deletes_the_prefixed_keys(storage, fakeredis, server):
+    other = fakeredis.FakeRedis(server=server)
+    other.set("other:a", b"1")
+    storage.add_many({str(i): {"n": i} for i in range(10)})
+    storage.clear()
+    assert storage.get_many([str(i) for i in range(10)]) == {}
+    assert other.get("other:a") == b"1"
+
+
+@pytest.fixture
+def sqlite_path(tmp_path) -> str:
+    return str(tmp_path / "sessions.sqlite3")
+
+
+def _sqlite(path: str, **kwargs):
+    from topicbot.storage import SQLiteStorage
+    kwargs.setdefault("ttl", 60)
+    kwargs.setdefault("purge_interval", 0)
+    return SQLiteStorage(path=path, codec=JSONCodec(), **kwargs)
+
+
+def test_sqlite_values_persist_across_reopening(sqlite_path):
+    storage = _sqlite(sqlite_path, synchronous="FULL")
+    storage.add("a", {"n": 1})
+    storage.add_many({"b": {"n": 2}, "c": {"n": 3}})
+    storage.close()
+
+    storage = _sqlite(sqlite_path)
+    assert storage.get("a") == {"n": 1}
+    assert "b" in storage and len(storage) == 3
+    storage.close()
+
+
+def test_sqlite_expired_keys(sqlite_path):
+    from topicbot.exceptions import KeyExpiredError
+    storage = _sqlite(sqlite_path)
+    storage.add("a", {"n": 1}, ttl=0.05)
+    storage.add("b", {"n": 2}, ttl=0.05)
+    storage.add("c", {"n": 3})
+    time.sleep(0.1)
+    assert "a" not in storage and storage.expired("a")
+    with pytest.raises(KeyExpiredError):
+        storage.get("a")
+    # the expired row is deleted when read
+    with pytest.raises(KeyError) as error:
+        storage.get("a")
+    assert not isinstance(error.value, KeyExpiredError)
+    assert storage.get_many(["a", "b", "c"]) == {"c": {"n": 3}}
+
+    assert len(storage) == 2
+    assert storage.purge() == 1
+    assert len(storage) == 1
+    storage.close()
+
+
+def test_sqlite_purges_when_writing_after_purge_interval(sqlite_path):
+    storage = _sqlite(sqlite_path, purge_interval=0.05)
+    storage.add("a", {"n": 1}, ttl=0.01)
+    time.sleep(0.1)
+    storage.add("b", {"n": 2})
+    assert len(storage) == 1
+    storage.close()
+
+
+def test_sqlite_bulk_operations_across_batches(sqlite_path):
+    from topicbot.storage import _sqlite_batch_size
+    storage = _sqlite(sqlite_path)
+    keys = ["k%d" % i for i in range(2 * _sqlite_batch_size + 1)]
+    storage.add_many({key: {"key": key} for key in keys})
+    values = storage.get_many(keys + ["missing"])
+    assert len(values) == len(keys)
+    assert values[keys[-1]] == {"key": keys[-1]}
+
+    storage.delete_many(keys[1:])
+    storage.delete("missing")
+    assert storage.get_many(keys) == {keys[0]: {"key": keys[0]}}
+    storage.close()
+
+
+def test_sqlite_compact_shrinks_the_files(sqlite_path):
+    storage = _sqlite(sqlite_path)
+    storage.add_many({"k%d" % i: {"text": "x" * 1000} for i in range(500)})
+    storage.add("keep", {"n": 1})
+    storage.add("old", {"n": 2}, ttl=0.01)
+    time.sleep(0.05)
+    storage.delete_many(["k%d" % i for i in range(500)])
+    before = os.path.getsize(sqlite_path)
+    storage.compact()
+    assert os.path.getsize(sqlite_path) < before
+    assert os.path.getsize(sqlite_path + "-wal") == 0
+    assert len(storage) == 1 and storage.get("keep") == {"n": 1}
+    storage.close()
+
+
+@pytest.fixture
+def memory():
+    from topicbot.storage import InMemoryStorage
+    # InMemoryStorage is a singleton, a fresh one is created from its class
+    cls = type(InMemoryStorage())
+
+    def create(**kwargs):
+        kwargs.setdefault("reaper_interval", 0)
+        storage = cls(**kwargs)
+        storage._codec = JSONCodec()
+        return storage
+
+    return create
+
+
+def test_memory_storage_is_shared_whatever_the_arguments():
+    from topicbot.storage import InMemoryStorage
+    assert InMemoryStorage(max_entries=1) is InMemoryStorage(max_entries=2)
+
+
+def test_memory_entries_expire_by_deadline(memory):
+    from topicbot.exceptions import KeyExpiredError
+    storage = memory()
+    now = time.time()
+    storage.add("a", {"n": 1}, ttl=10)
+    storage.add("b", {"n": 2}, ttl=20)
+    storage.add("c", {"n": 3}, ttl=30)
+    storage.add("a", {"n": 1}, ttl=40)      # outdates the first deadline
+    assert storage.expire(now + 25) == 1
+    assert "b" not in storage and "a" in storage and "c" in storage
+    assert storage.expire(now + 35, limit=5) == 1
+    assert storage.stats()["expirations"] == 2
+
+    storage.add("d", {"n": 4}, ttl=0.05)
+    time.sleep(0.1)
+    assert storage.expired("d")
+    with pytest.raises(KeyExpiredError):
+        storage.get("d")
+    assert "d" not in storage
+    assert storage.get_many(["a", "d"]) == {"a": {"n": 1}}
+
+
+def test_memory_evicts_least_recently_used_entries(memory):
+    storage = memory(max_entries=3)
+    storage.add_many({"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}})
+    storage.get("a")
+    storage.add("d", {"n": 4})
+    assert "b" not in storage
+    storage.get_many(["c"])
+    storage.add("e", {"n": 5})
+    assert sorted(storage.get_many(["a", "b", "c", "d", "e"])) == \
+        ["c", "d", "e"]
+    assert storage.stats()["evictions"] == 2
+
+
+def test_memory_evicts_beyond_max_bytes(memory):
+    size = len(JSONCodec().encode({"text": "x" * 100}))
+    storage = memory(max_bytes=3 * size)
+    for i in range(5):
+        storage.add("k%d" % i, {"text": "x" * 100})
+    stats = storage.stats()
+    assert stats["entries"] == 3 and stats["bytes"] == 3 * size
+    assert stats["evictions"] == 2 and stats["max_bytes"] == 3 * size
+    storage.delete("k4")
+    assert storage.stats()["bytes"] == 2 * size
+    storage.add("big", {"text": "x" * 300})
+    assert sorted(storage.get_many(["k2", "k3", "big"])) == ["big"]
+
+
+def test_sharded_storages_honour_their_arguments():
+    from topicbot.storage import ShardedMemoryStorage
+    storage = ShardedMemoryStorage(shards=4, ttl=10)
+    other = ShardedMemoryStorage(shards=8, ttl=20)
+    assert storage is not other
+    assert len(storage._shards) == 4 and len(other._shards) == 8
+    storage.add("a", {"n": 1})
+    assert "a" not in other
+
+
+def test_sharded_values_are_isolated_from_callers():
+    from topicbot.storage import ShardedMemoryStorage
+    storage = ShardedMemoryStorage(shards=4)
+    value = {"topics": [{"name": "a"}], "context": {"turn": 1}}
+    storage.add("a", value)
+    storage.add_many({"b": value})
+    value["topics"].append({"name": "b"})
+    value["context"]["turn"] = 2
+    expected = {"topics": [{"name": "a"}], "context": {"turn": 1}}
+    assert storage.get("a") == expected
+
+    read = storage.get("a")
+    read["topics"][0]["name"] = "changed"
+    read["context"].clear()
+    assert storage.get("a") == expected
+    read = storage.get_many(["b"])["b"]
+    read["topics"].clear()
+    assert storage.get_many(["a", "b"]) == {"a": expected, "b": expected}
+
+
+def test_sharded_entries_expire_across_shards():
+    from topicbot.exceptions import KeyExpiredError
+    from topicbot.storage import ShardedMemoryStorage
+    storage = ShardedMemoryStorage(shards=4, ttl=60)
+    keys = ["k%d" % i for i in range(40)]
+    assert len({storage._shard(key) for key in keys}) == 4
+    storage.add_many({key: {"key": key} for key in keys[:20]}, ttl=0.05)
+    storage.add_many({key: {"key": key} for key in keys[20:]})
+    time.sleep(0.1)
+    assert storage.get_many(keys) == {key: {"key": key} for key in keys[20:]}
+    assert keys[0] not in storage
+    with pytest.raises(KeyExpiredError):
+        storage.get(keys[0])
+    assert storage.expire() == 19
+    assert len(storage) == 20
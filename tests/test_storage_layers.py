@@ -0,0 +1,269 @@
+"""Tests of the storages layered over another one"""
+
+import time
+
+import pytest
+
+from topicbot.codecs import JSONCodec
+from topicbot.exceptions import KeyExpiredError
+from topicbot.storage import (InstrumentedStorage, Storage, TieredStorage,
+                              WriteBehindStorage)
+
+
+class _DictStorage(Storage):
+    """Backend keeping encoded values in a dict, logging its operations."""
+
+    def __init__(self, ttl: int=60):
+        super().__init__(ttl, JSONCodec())
+        self._store = dict()
+        self.calls = []
+        self.fail = False
+        self.expired_keys = set()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._store
+
+    def add(self, key: str, value: dict, ttl: int=None):
+        self.add_many({key: value}, ttl)
+
+    def add_many(self, items: dict, ttl: int=None):
+        self.calls.append(("add_many", sorted(items), ttl))
+        if self.fail:
+            raise ConnectionError("backend down")
+        for key, value in items.items():
+            self._store[key] = self._codec.encode(value)
+
+    def clear(self):
+        self._store.clear()
+
+    def delete(self, key: str):
+        self.delete_many([key])
+
+    def delete_many(self, keys: list):
+        self.calls.append(("delete_many", sorted(keys)))
+        if self.fail:
+            raise ConnectionError("backend down")
+        for key in keys:
+            self._store.pop(key, None)
+
+    def expired(self, key: str) -> bool:
+        return key not in self._store
+
+    def get(self, key: str) -> dict:
+        self.calls.append(("get", key))
+        if self.fail:
+            raise ConnectionError("backend down")
+        if key in self.expired_keys:
+            raise KeyExpiredError(key)
+        if key not in self._store:
+            raise KeyError(key)
+        return self._codec.decode(self._store[key])
+
+    def get_many(self, keys: list) -> dict:
+        self.calls.append(("get_many", sorted(keys)))
+        return {key: self._codec.decode(self._store[key])
+                for key in keys if key in self._store}
+
+
+def test_tiered_storages_wrap_their_own_backend():
+    first, second = _DictStorage(), _DictStorage()
+    tiered = TieredStorage(backend=first, max_entries=10)
+    other = TieredStorage(backend=second, max_entries=10)
+    assert tiered is not other
+    tiered.add("a", {"n": 1})
+    assert "a" in first and "a" not in second
+    assert other.get_many(["a"]) == {}
+
+
+def test_tiered_l1_hits_only_read_the_version():
+    backend = _DictStorage()
+    tiered = TieredStorage(backend=backend, max_entries=2,
+                           validate_interval=0)
+    tiered.add("a", {"n": 1})
+    backend.calls = []
+    value = tiered.get("a")
+    assert value == {"n": 1}
+    assert backend.calls == [("get_many", ["a#version"])]
+
+    # written meanwhile by another process
+    backend.add("a", {"n": 2})
+    backend.add("a#version", {"version": "other"})
+    assert tiered.get("a") == {"n": 2}
+    assert tiered.stats()["l1_stale"] == 1
+
+    tiered.add_many({"b": {"n": 3}, "c": {"n": 4}})
+    assert len(tiered) == 2 and tiered.stats()["evictions"] == 1
+
+
+def test_tiered_validated_entries_skip_the_backend():
+    backend = _DictStorage()
+    tiered = TieredStorage(backend=backend, validate_interval=60)
+    tiered.add("a", {"n": 1})
+    backend.calls = []
+    assert tiered.get("a") == {"n": 1}
+    assert backend.calls == []
+    tiered.get("a")["n"] = 2
+    assert tiered.get("a") == {"n": 1}
+
+
+def test_instrumented_storages_wrap_their_own_backend():
+    first, second = _DictStorage(), _DictStorage()
+    instrumented = InstrumentedStorage(backend=first, size_sample=1)
+    other = InstrumentedStorage(backend=second, size_sample=0)
+    assert instrumented is not other
+    assert instrumented.backend is first and other.backend is second
+    other.add("a", {"n": 1})
+    assert other.snapshot()["payload_bytes"]["write"]["count"] == 0
+
+
+def test_instrumented_lookups_latency_and_sizes():
+    backend = _DictStorage()
+    instrumented = InstrumentedStorage(backend=backend, size_sample=1)
+    instrumented.add("a", {"n": 1})
+    instrumented.add_many({"b": {"n": 2}, "c": {"n": 3}})
+    backend.expired_keys.add("c")
+
+    assert instrumented.get("a") == {"n": 1}
+    with pytest.raises(KeyError):
+        instrumented.get("x")
+    with pytest.raises(KeyExpiredError):
+        instrumented.get("c")
+    assert instrumented.get_many(["a", "b", "y"]) == \
+        {"a": {"n": 1}, "b": {"n": 2}}
+    backend.fail = True
+    with pytest.raises(ConnectionError):
+        instrumented.get("a")
+
+    snapshot = instrumented.snapshot()
+    assert snapshot["lookups"] == {"hit": 3, "miss": 2, "expired": 1}
+    operations = snapshot["operations"]
+    assert operations["get"]["latency"]["count"] == 4
+    # misses are expected, only the failure of the backend is an error
+    assert operations["get"]["errors"] == 1
+    assert operations["add_many"]["latency"]["count"] == 1
+    write = snapshot["payload_bytes"]["write"]
+    assert write["count"] == 3
+    assert write["sum"] == 3 * len(JSONCodec().encode({"n": 1}))
+    assert snapshot["payload_bytes"]["read"]["count"] == 3
+
+    instrumented.reset()
+    assert instrumented.snapshot()["lookups"] == \
+        {"hit": 0, "miss": 0, "expired": 0}
+
+
+def test_instrumented_prometheus_text():
+    instrumented = InstrumentedStorage(backend=_DictStorage(), size_sample=1)
+    instrumented.add("a", {"n": 1})
+    instrumented.get("a")
+    lines = instrumented.prometheus(prefix="tb").splitlines()
+    assert "# TYPE tb_operation_seconds histogram" in lines
+    assert 'tb_operation_seconds_bucket{le="+Inf",operation="get"} 1' \
+        in lines
+    assert 'tb_operation_seconds_count{operation="get"} 1' in lines
+    assert 'tb_errors_total{operation="get"} 0' in lines
+    assert 'tb_lookups_total{result="hit"} 1' in lines
+    assert 'tb_payload_bytes_count{direction="write"} 1' in lines
+
+
+@pytest.fixture
+def write_behind():
+    storages = []
+
+    def create(backend: Storage, **kwargs) -> WriteBehindStorage:
+        kwargs.setdefault("flush_interval", 60)
+        kwargs.setdefault("batch_size", 100)
+        kwargs.setdefault("max_pending", 1000)
+        storage = WriteBehindStorage(backend=backend, **kwargs)
+        storages.append(storage)
+        return storage
+
+    yield create
+    for storage in storages:
+        storage.close()
+
+
+def test_write_behind_storages_wrap_their_own_backend(write_behind):
+    first, second = _DictStorage(), _DictStorage()
+    storage = write_behind(first, batch_size=10)
+    other = write_behind(second, batch_size=20)
+    assert storage is not other
+    assert other._batch_size == 20
+    storage.add("a", {"n": 1})
+    storage.flush()
+    assert "a" in first and "a" not in second
+
+
+def test_write_behind_coalesces_and_reads_its_own_writes(write_behind):
+    backend = _DictStorage()
+    storage = write_behind(backend)
+    for n in range(3):
+        storage.add("a", {"n": n})
+    storage.add("b", {"n": 0}, ttl=5)
+    storage.delete("c")
+    assert len(storage) == 3
+    assert backend.calls == []
+    assert storage.get("a") == {"n": 2}
+    assert storage.get_many(["a", "b", "c"]) == {"a": {"n": 2}, "b": {"n": 0}}
+
+    backend.add("d", {"n": 0})
+    storage.delete("d")
+    assert "d" not in storage
+    with pytest.raises(KeyError):
+        storage.get("d")
+
+    backend.calls = []
+    storage.flush()
+    assert len(storage) == 0
+    assert sorted(backend.calls) == [("add_many", ["a"], None),
+                                     ("add_many", ["b"], 5),
+                                     ("delete_many", ["c", "d"])]
+    assert backend.get("a") == {"n": 2} and "d" not in backend
+
+
+def test_write_behind_flushes_in_add_beyond_max_pending(write_behind):
+    backend = _DictStorage()
+    storage = write_behind(backend, max_pending=3)
+    storage.add("a", {"n": 1})
+    storage.add("b", {"n": 2})
+    assert len(storage) == 2 and "a" not in backend
+    storage.add("c", {"n": 3})
+    assert len(storage) == 0
+    assert backend.get_many(["a", "b", "c"]) == \
+        {"a": {"n": 1}, "b": {"n": 2}, "c": {"n": 3}}
+
+
+def test_write_behind_retries_after_a_failed_flush(write_behind):
+    backend = _DictStorage()
+    storage = write_behind(backend)
+    storage.add("a", {"n": 1})
+    storage.add("b", {"n": 1})
+    backend.fail = True
+    storage.flush()
+    assert len(storage) == 2
+    assert storage.get("a") == {"n": 1}
+
+    # written again before the retry, the newer value wins
+    storage.add("a", {"n": 2})
+    backend.fail = False
+    storage.flush()
+    assert len(storage) == 0
+    assert backend.get_many(["a", "b"]) == {"a": {"n": 2}, "b": {"n": 1}}
+
+
+def test_write_behind_close_flushes_and_stops(write_behind):
+    backend = _DictStorage()
+    storage = write_behind(backend)
+    storage.add("a", {"n": 1})
+    storage.close()
+    assert not storage._flusher.is_alive()
+    assert backend.get("a") == {"n": 1}
+
+
+def test_write_behind_flusher_thread_writes_full_batches(write_behind):
+    backend = _DictStorage()
+    storage = write_behind(backend, batch_size=2)
+    storage.add_many({"a": {"n": 1}, "b": {"n": 2}})
+    deadline = time.time() + 5
+    while len(storage) and time.time() < deadline:
+        time.sleep(0.01)
+    assert backend.get_many(["a", "b"]) == {"a": {"n": 1}, "b": {"n": 2}}
@@ -0,0 +1,371 @@
+import os
+
+import pytest
+
+from topicbot.exceptions import TopicDefinitionError
+from topicbot.topic import Topic
+
+
+class _Dialog:
+
+    def __init__(self, data: dict):
+        self._data = data
+
+    def get(self, key: str):
+        return self._data.get(key)
+
+
+class _Weather(Topic):
+
+    @classmethod
+    def _name(cls) -> str:
+        return "weather"
+
+    def intent_maps(self) -> dict:
+        return {
+            "weather.city": {
+                "method": "_city",
+                "params": [{"param": "city", "meaning": "the city"}]},
+            "weather.static": {"method": "_static"},
+            "weather.class": {"method": "_class"},
+            "weather.instance": {"method": "_instance"}
+        }
+
+    def _respond_params_missing(self, label: str, params: list) -> dict:
+        return {"ask": [param["meaning"] for param in params]}
+
+    def _city(self) -> dict:
+        return {"city": self.get("city")}
+
+    @staticmethod
+    def _static() -> list:
+        return [{"static": 1}, {"static": 2}]
+
+    @classmethod
+    def _class(cls) -> dict:
+        return {"class": cls.__name__}
+
+    def _instance(self) -> dict:
+        return {"instance": "class"}
+
+
+def test_dispatch_checks_the_declared_params():
+    topic = _Weather()
+    assert topic.respond(_Dialog({"city": "Paris"}), "weather.city") == \
+        [{"city": "Paris"}]
+    assert topic.respond(_Dialog({}), "weather.city") == \
+        {"ask": ["the city"]}
+
+
+def test_dispatch_binds_handlers_like_getattr():
+    topic = _Weather()
+    topic._instance = lambda: {"instance": "override"}
+    dialog = _Dialog({})
+    assert topic.respond(dialog, "weather.static") == \
+        [{"static": 1}, {"static": 2}]
+    assert topic.respond(dialog, "weather.class") == [{"class": "_Weather"}]
+    assert topic.respond(dialog, "weather.instance") == \
+        [{"instance": "override"}]
+
+
+def test_subclasses_get_their_own_table():
+    class _Forecast(_Weather):
+
+        def intent_maps(self) -> dict:
+            return {"forecast": {"method": "_city"}}
+
+    _Weather.compile_dispatch()
+    assert set(_Forecast.compile_dispatch()) == {"forecast"}
+    assert "forecast" not in _Weather._dispatch
+
+
+def test_maps_of_initialized_instances_are_dispatched_per_turn(monkeypatch):
+    class _Local(_Weather):
+
+        def __init__(self, city: str):
+            super().__init__()
+            self._city_name = city
+
+        def intent_maps(self) -> dict:
+            return {"local": {"method": "_local", "params": [
+                {"param": self._city_name, "meaning": "the city"}]}}
+
+        def _local(self) -> dict:
+            return {"local": self.get(self._city_name)}
+
+    assert _Local.compile_dispatch() == {}
+    compiled = []
+    monkeypatch.setattr(_Local, "_compile_intent", classmethod(
+        lambda cls, label, intent: compiled.append(label)))
+    assert _Local("paris").respond(_Dialog({"paris": 20}), "local") == \
+        [{"local": 20}]
+    assert _Local("rome").respond(_Dialog({}), "local") == \
+        {"ask": ["the city"]}
+    assert compiled == []
+
+
+@pytest.mark.parametrize("intent", [
+    {"desc": "no method"},
+    {"method": "_missing"},
+    {"method": "_city", "params": "city"},
+    {"method": "_city", "params": ["city"]},
+])
+def test_invalid_maps_fail_at_load(intent):
+    class _Invalid(_Weather):
+
+        def intent_maps(self) -> dict:
+            return {"invalid": intent}
+
+    with pytest.raises(TopicDefinitionError):
+        _Invalid.compile_dispatch()
+
+
+class _Forecast(_Weather):
+
+    stateless = True
+
+
+def test_stateless_topics_are_reused_per_thread_until_topics_change():
+    from topicbot.topic import TopicFactory
+    factory = TopicFactory()
+    factory.update_topics({"forecast": _Forecast})
+
+    topic = factory.create_topic("forecast", "a")
+    id = topic.id
+    assert factory.create_topic("forecast", "b") is topic
+    assert topic.id == id
+
+    factory.update_topics({"forecast": _Forecast})
+    assert factory.create_topic("forecast") is not topic
+    factory.remove_topics(["forecast"])
+
+
+def test_reused_topics_keep_no_dialog_nor_dead_threads():
+    import gc
+    import threading
+    from topicbot.topic import TopicFactory
+    factory = TopicFactory()
+    factory.update_topics({"forecast": _Forecast})
+
+    topic = factory.create_topic("forecast")
+    assert topic.respond(_Dialog({"city": "Paris"}), "weather.city") == \
+        [{"city": "Paris"}]
+    assert topic.dialog is None
+
+    threads = [threading.Thread(target=factory.create_topic,
+                                args=("forecast",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    assert len(factory._pools) >= 5
+    del thread, threads
+    gc.collect()
+    assert list(factory._pools) == [threading.current_thread()]
+    factory.remove_topics(["forecast"])
+
+
+def _linear_match(names: list, intent_label: str) -> str:
+    """The scan TopicFactory.get_topic_name did before the trie."""
+    match = 0
+    topic_name = ""
+    for name in names:
+        if intent_label.startswith(name) and len(name) > match:
+            topic_name = name
+            match = len(name)
+    return topic_name
+
+
+def test_trie_matches_like_the_linear_scan():
+    import random
+    from topicbot.topic import _TopicRegistry
+    names = ["weather", "weather.city", "weather.city.rain", "wea",
+             "music", "music.play.jazz", "m", ""]
+    registry = _TopicRegistry({name: _Weather for name in names[:4]},
+                              {name: "/topics.py" for name in names[4:]})
+    labels = ["weather.city.rain.today", "weather.city", "weather.cit",
+              "weathe", "we", "music.play", "music.play.jazz.live", "mu",
+              "x.weather", "", "Weather"]
+    rng = random.Random(7)
+    labels += ["".join(rng.choice("weather.city.music") for _ in range(12))
+               for _ in range(200)]
+    for label in labels:
+        assert registry.match(label) == _linear_match(names, label), label
+    # memoized
+    for label in labels:
+        assert registry.match(label) == _linear_match(names, label), label
+    assert registry.match("nothing") == ""
+
+
+def test_swapped_registry_drops_the_memo():
+    from topicbot.topic import TopicFactory
+    factory = TopicFactory()
+    factory.update_topics({"trie": _Weather})
+    assert factory.get_topic_name("trie.deep.label") == "trie"
+    factory.update_topics({"trie.deep": _Weather})
+    assert factory.get_topic_name("trie.deep.label") == "trie.deep"
+    factory.remove_topics(["trie.deep"])
+    assert factory.get_topic_name("trie.deep.label") == "trie"
+    factory.remove_topics(["trie"])
+    assert factory.get_topic_name("trie.deep.label") == ""
+
+
+_topic_source = '''
+from topicbot.topic import Topic
+
+
+class {cls}(Topic):
+
+    @classmethod
+    def _name(cls) -> str:
+        return "{name}"
+
+    def intent_maps(self) -> dict:
+        return {{}}
+'''
+
+
+@pytest.fixture
+def topics_folder(tmp_path, monkeypatch):
+    """Folder of two topic files, and the paths _import_topics imported."""
+    import topicbot.topic
+    folder = tmp_path / "topics"
+    folder.mkdir()
+    for cls, name in (("Weather", "weather"), ("Music", "music")):
+        (folder / (name + ".py")).write_text(
+            _topic_source.format(cls=cls, name=name))
+    imported = []
+    import_topics = topicbot.topic._import_topics
+
+    def counting(path: str) -> dict:
+        imported.append(os.path.basename(path))
+        return import_topics(path)
+
+    monkeypatch.setattr(topicbot.topic, "_import_topics", counting)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return str(folder), imported
+
+
+def test_lazy_load_imports_only_new_or_changed_files(topics_folder):
+    from topicbot.topic import _TopicFolder
+    path, imported = topics_folder
+    folder = _TopicFolder(path, lazy_load=True)
+    folder.load()
+    assert sorted(imported) == ["music.py", "weather.py"]
+    assert not folder.manifest_path.startswith(path)
+    # nothing written into the topics folder
+    assert sorted(os.listdir(path)) == ["music.py", "weather.py"]
+    assert os.path.isfile(folder.manifest_path)
+
+    # a second start only stats the files
+    imported.clear()
+    folder = _TopicFolder(path, lazy_load=True)
+    folder.load()
+    assert imported == []
+    assert sorted(folder.registry.names()) == ["music", "weather"]
+    assert folder.registry.match("weather.city") == "weather"
+    assert imported == []
+
+    # the first topic created imports its file only
+    topic = folder.registry.get("weather")
+    assert imported == ["weather.py"] and topic._name() == "weather"
+    assert folder.registry.get("weather") is topic
+    assert imported == ["weather.py"]
+
+    imported.clear()
+    stat = os.stat(os.path.join(path, "music.py"))
+    os.utime(os.path.join(path, "music.py"),
+             ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    folder = _TopicFolder(path, lazy_load=True)
+    folder.load()
+    assert imported == ["music.py"]
+
+
+def test_eager_load_imports_every_file(topics_folder):
+    from topicbot.topic import _TopicFolder
+    path, imported = topics_folder
+    _TopicFolder(path, lazy_load=True).load()
+    imported.clear()
+    _TopicFolder(path, lazy_load=False).load()
+    assert sorted(imported) == ["music.py", "weather.py"]
+
+
+class _Configs:
+
+    def __init__(self, values: dict):
+        self._values = values
+
+    def get(self, section: str, option: str) -> str:
+        return self._values.get((section, option), "")
+
+
+@pytest.fixture
+def customers_factory(tmp_path, monkeypatch):
+    """TopicFactory with per_customer on: weather and music shared, weather
+    of its own for customer acme."""
+    import topicbot.topic
+    from topicbot.topic import TopicFactory
+    root = tmp_path / "topics"
+    (root / "acme").mkdir(parents=True)
+    (root / "shared.py").write_text(
+        _topic_source.format(cls="Weather", name="weather") +
+        _topic_source.format(cls="Music", name="music"))
+    (root / "acme" / "weather.py").write_text(
+        _topic_source.format(cls="AcmeWeather", name="weather") +
+        _topic_source.format(cls="AcmeRain", name="weather.rain"))
+    (tmp_path / "outside.py").write_text(
+        _topic_source.format(cls="Outside", name="outside"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(topicbot.topic, "configs", _Configs({
+        ("Topics", "topic_path"): str(root),
+        ("Topics", "per_customer"): "true",
+        ("Topics", "customer_idle_ttl"): "60"}))
+    # TopicFactory is a singleton, a fresh one is created from its class
+    return type(TopicFactory())()
+
+
+def test_customer_topics_are_loaded_on_demand(customers_factory):
+    factory = customers_factory
+    assert factory.customers_stats() == {}
+    assert sorted(factory._folder.registry.names()) == ["music", "weather"]
+
+    assert type(factory.create_topic("weather")).__name__ == "Weather"
+    topic = factory.create_topic("weather", customer="acme")
+    assert type(topic).__name__ == "AcmeWeather"
+    assert list(factory.customers_stats()) == ["acme"]
+    # shared topics are still found
+    assert type(factory.create_topic("music", customer="acme")).__name__ == \
+        "Music"
+    assert factory.get_topic_name("weather.rain.today", "acme") == \
+        "weather.rain"
+    assert factory.get_topic_name("weather.rain.today") == "weather"
+    assert factory.get_topic_name("music.jazz", "acme") == "music"
+
+    # customers without a folder get the shared topics
+    assert factory.get_topic_name("weather.rain", "other") == "weather"
+
+
+@pytest.mark.parametrize("customer", ["..", ".", "../topics", "acme/..",
+                                      "/tmp"])
+def test_customer_names_cannot_escape_topic_path(customers_factory,
+                                                 customer):
+    factory = customers_factory
+    assert factory._customer_folder(customer) is None
+    assert not factory.has_topic("outside", customer=customer)
+    assert factory.customers_stats() == {}
+
+
+def test_idle_customers_are_evicted(customers_factory):
+    import time
+    factory = customers_factory
+    factory.create_topic("weather", customer="acme")
+    factory.get_topic_name("weather", customer="other")
+    now = time.time()
+    factory._customers["other"].last_used = now - 30
+
+    assert factory.evict_idle(now + 45) == ["other"]
+    assert list(factory.customers_stats()) == ["acme"]
+    assert factory.evict_idle(now + 61) == ["acme"]
+    assert factory.customers_stats() == {}
+    # loaded again on the next message
+    assert type(factory.create_topic("weather", customer="acme")).__name__ \
+        == "AcmeWeather"
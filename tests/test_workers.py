@@ -0,0 +1,143 @@
+import os
+import time
+import signal
+
+import pytest
+
+from topicbot.configs import configs
+from topicbot.response import Response, ResponseFactory
+from topicbot.workers import BotPool
+
+
+_echo_protocol = 101
+
+_echo_module = """from topicbot.response import Response
+
+
+class EchoResponse(Response):
+
+    protocol = {protocol}
+
+    def template(self) -> dict:
+        return {{"msg": "", "pid": None}}
+
+    def values(self) -> dict:
+        return dict(self._output, delay=self.delay)
+""".format(protocol=_echo_protocol)
+
+
+class _Unserializable:
+
+    user = "u1"
+
+    def __repr__(self):
+        raise TypeError("not serializable")
+
+
+class _Echo(Response):
+    """Response of a worker, rebuilt by ResponseFactory in the front."""
+
+    protocol = _echo_protocol
+
+
+class _EchoBot:
+    """Sends every message back, after a response failing to serialize."""
+
+    def __init__(self):
+        self._responses = []
+
+    def respond(self, msg: dict):
+        response_data = {"protocol": _echo_protocol,
+                         "output": {"msg": msg["text"], "pid": os.getpid()},
+                         "delay": msg.get("delay"),
+                         "no_delay": not msg.get("delay")}
+        self._responses += [_Unserializable(),
+                            _Echo(response_data, msg)]
+
+    def get_responses(self) -> list:
+        responses, self._responses = self._responses, []
+        return responses
+
+
+def _echo_bot() -> _EchoBot:
+    return _EchoBot()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def echo_response():
+    path = os.path.join(configs.get("Responses", "response_path"),
+                        "echo_response.py")
+    with open(path, "w") as f:
+        f.write(_echo_module)
+    ResponseFactory().reload()
+    yield
+    os.remove(path)
+    ResponseFactory().reload()
+
+
+def _collect(pool: BotPool, count: int, timeout: float=10) -> list:
+    """Responses of the pool, once count of them were collected."""
+    responses = []
+    deadline = time.time() + timeout
+    while len(responses) < count and time.time() < deadline:
+        responses += pool.get_responses()
+        time.sleep(0.01)
+    assert len(responses) == count
+    return responses
+
+
+def test_responses_are_rebuilt_in_the_front_process():
+    with BotPool(_echo_bot, workers=1, initiative=False,
+                 start_method="fork") as pool:
+        pool.respond({"user": "u1", "text": "a long enough reply"})
+        pool.respond({"user": "u1", "text": "b", "delay": 2.5})
+        first, second = _collect(pool, 2)
+
+    assert type(first).__name__ == "EchoResponse"
+    assert not isinstance(first, _Echo)
+    assert first.user == "u1"
+    assert first.msg_data["text"] == "a long enough reply"
+    # no delay in the worker, and none drawn again by the front
+    assert first.delay == 0
+    assert first.values()["msg"] == "a long enough reply"
+    assert first.values()["pid"] != os.getpid()
+    assert second.delay == 2.5
+
+
+def test_users_are_routed_to_workers_by_crc32():
+    users = ["user%d" % i for i in range(20)]
+    with BotPool(_echo_bot, workers=3, initiative=False,
+                 start_method="fork") as pool:
+        assert {pool.worker_index(user) for user in users} == {0, 1, 2}
+        for turn in range(2):
+            for user in users:
+                pool.respond({"user": user, "text": str(turn)})
+        responses = _collect(pool, 2 * len(users))
+        pids = [process.pid for process in pool._processes]
+
+    for user in users:
+        texts = [r.values()["msg"] for r in responses if r.user == user]
+        assert texts == ["0", "1"]
+        assert {r.values()["pid"] for r in responses if r.user == user} == \
+            {pids[pool.worker_index(user)]}
+
+
+def test_workers_survive_bad_responses_and_are_restarted():
+    with BotPool(_echo_bot, workers=2, initiative=False,
+                 start_method="fork") as pool:
+        users = ["user%d" % i for i in range(20)]
+        killed = next(u for u in users if pool.worker_index(u) == 0)
+        other = next(u for u in users if pool.worker_index(u) == 1)
+
+        pool.respond({"user": killed, "text": "a"})
+        pid = _collect(pool, 1)[0].values()["pid"]
+        os.kill(pid, signal.SIGKILL)
+        pool._processes[0].join(10)
+
+        pool.respond({"user": killed, "text": "b"})
+        pool.respond({"user": other, "text": "c"})
+        responses = {r.user: r for r in _collect(pool, 2)}
+        assert responses[killed].values()["msg"] == "b"
+        assert responses[killed].values()["pid"] != pid
+        assert responses[other].values()["msg"] == "c"
+        assert pool.restarts == 1
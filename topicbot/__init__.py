@@ -1,7 +1,10 @@
 from .bot import Bot
+from .aio import AsyncBot
+from .workers import BotPool
 from .client import Client
 from .topic import Topic, TopicFactory
 from .dialog import Dialog
 from .response import Response, ResponseFactory
+from .delivery import ResponseDispatcher
 from .context import Context
 from .grounding import Grounding
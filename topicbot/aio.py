@@ -0,0 +1,102 @@
+"""asyncio-native chatbot"""
+
+import time
+import asyncio
+
+from typing import AsyncIterator, List
+
+from .base import Base
+from .bot import Bot
+from .client import Client
+from .exceptions import MsgError
+from .response import Response
+
+
+class AsyncBot(Bot):
+    """Bot with awaitable respond for asyncio-based gateways.
+
+    Models whose ner/predict are coroutine functions are awaited, sync-only
+    ones are run in the executor. Storage operations go through the
+    awaitable Storage.aget/aadd.
+    """
+
+    def __init__(self, configs_path: str, ner, intent_classifiers: dict,
+                 executor=None):
+        """
+
+        Parameters
+        ----------
+        configs_path: absolute path of the config file.
+        executor: concurrent.futures.Executor to run sync-only models in, the
+            default executor of the event loop if None.
+        """
+        super().__init__(configs_path, ner, intent_classifiers)
+        self._executor = executor
+        self._alocks = [asyncio.Lock() for _ in self._shards]
+        self._wakeup = asyncio.Event()
+
+    async def respond(self, msg: dict):
+        """Awaitable Bot.respond."""
+        for field in ["user"]:
+            if not str(msg.get(field, "")).strip():
+                raise MsgError
+
+        customer = msg.get("customer", "common")
+        user = msg["user"]
+
+        async with self._alocks[hash(user) % len(self._alocks)]:
+            try:
+                cache = await Base.aget_cache_by_id(user)
+            except KeyError:
+                cache = {}
+            client = Client(msg, self._ner, self._intent_classifiers[customer],
+                            cache=cache, parse=False)
+            await client.async_parse(self._executor)
+            now = time.time()
+            for response in client.respond():
+                self._responses.push(response, response.delay, now)
+            self._wakeup.set()
+
+            self._update(client)
+            await client.asave()
+
+    async def actively_respond(self, user: str):
+        """Awaitable Bot.actively_respond."""
+        cache = await Base.aget_cache_by_id(user)
+        if cache:
+            msg = cache.get("msg", {})
+            if msg:
+                msg["text"] = ""
+                msg["initiative"] = True
+                await self.respond(msg)
+
+    async def actively_respond_many(self, users: List[str]):
+        """Awaitable Bot.actively_respond_many."""
+        caches = await Base.aget_caches_by_ids(users)
+        for user in users:
+            msg = caches.get(user, {}).get("msg", {})
+            if msg:
+                msg["text"] = ""
+                msg["initiative"] = True
+                await self.respond(msg)
+
+    async def responses(self) -> AsyncIterator[Response]:
+        """Yield responses as they fall due, forever.
+
+        The iterator sleeps until the next response is due, and is woken up
+        early when respond() schedules new responses.
+        """
+        while True:
+            self._wakeup.clear()
+            due = self._responses.next_due()
+            now = time.time()
+            if due is not None and due <= now:
+                for response in self._responses.pop_due(now):
+                    yield response
+                continue
+
+            timeout = None if due is None else due - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -1,35 +1,148 @@
 """Base class for the bot objects"""
 
 import logging
-import uuid
 import json
+import operator
+
+from threading import Lock
 
 from .configs import configs
-from .utils import import_module
+from .utils import import_module, new_id
 from .storage import Storage
 
 
+_storages = dict()      # [Base] storage -> its instance
+_storages_lock = Lock()
+
+
 def _get_storage() -> Storage:
-    return import_module(module_path=configs.get("Base", "storage"),
-                         root_path=configs.get("Root", "root_path"))()
+    """Storage set by [Base] storage, created once and shared by all the
+    Base subclasses."""
+    path = configs.get("Base", "storage")
+    storage = _storages.get(path)
+    if storage is None:
+        with _storages_lock:
+            storage = _storages.get(path)
+            if storage is None:
+                storage = import_module(
+                    module_path=path,
+                    root_path=configs.get("Root", "root_path"))()
+                _storages[path] = storage
+    return storage
+
+
+def _lazy_property(attr: str, prop: property) -> property:
+    """Wrap the property of attr to hydrate it from the restored cache data
+    on first access."""
+    fget, fset = prop.fget, prop.fset
+
+    def getter(self):
+        raw = self._raw
+        if raw and attr in raw:
+            value = raw.pop(attr)
+            try:
+                fset(self, value)
+            except Exception:
+                pass
+        return fget(self)
+
+    def setter(self, value):
+        # an explicit assignment overrides the cached data
+        raw = self._raw
+        if raw:
+            raw.pop(attr, None)
+        fset(self, value)
+
+    getter.unwrapped = fget
+    setter.unwrapped = fset
+    return property(getter, setter, prop.fdel, prop.__doc__)
+
+
+_repr_implemented = dict()  # type -> whether its __repr__ is implemented
+
+
+def _check_repr(value) -> bool:
+    cls = type(value)
+    implemented = _repr_implemented.get(cls)
+    if implemented is None:
+        implemented = cls.__repr__ is not object.__repr__
+        _repr_implemented[cls] = implemented
+    if not implemented:
+        logging.error("%s.__repr__() is not implemented!" % cls.__name__)
+    return implemented
 
 
 class Base:
+    """
+    Attributes in _attrs are saved to and restored from storage. Those
+    exposed as properties with a setter are hydrated lazily, on first access;
+    until then save() passes their cached data through untouched.
+    _lazy_restore selects them: True for all of them, False for none, e.g.
+    in subclasses reading all of them anyway on every use, or the names of
+    the lazy ones.
+
+    The accessors of _attrs are built once per subclass, and the per-turn
+    subclasses use __slots__.
+    """
+
+    __slots__ = ("_id", "_raw")
 
     _attrs = []
+    _lazy_restore = True
+    _lazy_attrs = frozenset()
+    _serializers = ()   # (attr, accessor) of each attr in _attrs
     _storage = None
 
-    def __init__(self, id: str=None):
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        lazy_attrs = set()
+        serializers = []
+        lazy_restore = cls._lazy_restore
+        for attr in cls._attrs:
+            prop = getattr(cls, attr, None)
+            if not isinstance(prop, property) or prop.fset is None:
+                serializers.append((attr, operator.attrgetter(attr)))
+                continue
+            lazy = lazy_restore if isinstance(lazy_restore, bool) \
+                else attr in lazy_restore
+            wrapped = hasattr(prop.fget, "unwrapped")
+            if lazy and not wrapped:
+                prop = _lazy_property(attr, prop)
+                setattr(cls, attr, prop)
+            elif wrapped and not lazy:
+                # inherited from a lazy parent, back to the plain accessors
+                prop = property(prop.fget.unwrapped, prop.fset.unwrapped,
+                                prop.fdel, prop.__doc__)
+                setattr(cls, attr, prop)
+            if lazy:
+                lazy_attrs.add(attr)
+                # values() serves the cached data itself, so the getter
+                # does not need to hydrate
+                serializers.append((attr, prop.fget.unwrapped))
+            else:
+                serializers.append((attr, operator.attrgetter(attr)))
+        cls._lazy_attrs = frozenset(lazy_attrs)
+        cls._serializers = tuple(serializers)
+
+    def __init__(self, id: str=None, cache: dict=None):
+        """
+        :param id: id of the instance to restore from storage, a new id will
+            be generated if it is None.
+        :param cache: data already read from storage for id, to restore from
+            instead of reading storage again.
+        """
         if id is None:
-            self._id = str(uuid.uuid1())
+            self._id = new_id()
         else:
             self._id = id
-            self._restore()
+            self._restore(cache)
 
     def __new__(cls, *args, **kwargs):
         if cls._storage is None:
             cls._storage = _get_storage()
-        return super().__new__(cls)
+        instance = super().__new__(cls)
+        instance._raw = None    # cache data not hydrated yet
+        return instance
 
     def __repr__(self):
         return json.dumps(self.values)
@@ -45,13 +158,14 @@ class Base:
     @property
     def values(self) -> dict:
         values = dict()
-        for attr in self._attrs:
-            value = getattr(self, attr)
-            if type(value).__repr__ is object.__repr__:
-                logging.error("%s.__repr__() is not implemented!" %
-                              value.__class__.__name__)
+        raw = self._raw
+        for attr, get in self._serializers:
+            if raw and attr in raw:
+                values[attr] = raw[attr]
                 continue
-            values[attr] = value
+            value = get(self)
+            if _repr_implemented.get(type(value)) or _check_repr(value):
+                values[attr] = value
 
         return values
 
@@ -77,16 +191,50 @@ class Base:
             cls._storage = _get_storage()
         return cls._storage.get(id)
 
-    def _restore(self):
-        """Restore cache data to self instance"""
-        cache = self._cache()
+    @classmethod
+    def get_caches_by_ids(cls, ids: list) -> dict:
+        """Get data of ids from storage in one operation. Ids without data
+        are left out of the returned dict."""
+        if cls._storage is None:
+            cls._storage = _get_storage()
+        return cls._storage.get_many(ids)
+
+    @classmethod
+    async def aget_cache_by_id(cls, id: str):
+        """Awaitable get_cache_by_id."""
+        if cls._storage is None:
+            cls._storage = _get_storage()
+        return await cls._storage.aget(id)
+
+    @classmethod
+    async def aget_caches_by_ids(cls, ids: list) -> dict:
+        """Awaitable get_caches_by_ids."""
+        if cls._storage is None:
+            cls._storage = _get_storage()
+        return await cls._storage.aget_many(ids)
+
+    def _restore(self, cache: dict=None):
+        """Restore cache data to self instance. Lazy attributes are only
+        hydrated on first access."""
+        if cache is None:
+            cache = self._cache()
         if cache:
+            raw = dict()
             for attr in self._attrs:
+                if attr not in cache:
+                    continue
+                if attr in self._lazy_attrs:
+                    raw[attr] = cache[attr]
+                    continue
                 try:
                     setattr(self, attr, cache[attr])
                 except Exception:
                     continue
+            self._raw = raw
 
     def save(self):
         self._storage.add(self._id, self.values)
 
+    async def asave(self):
+        await self._storage.aadd(self._id, self.values)
+
@@ -2,9 +2,9 @@
 
 import logging
 import time
-import random
+import itertools
 
-from threading import RLock
+from threading import RLock, Lock
 from collections import OrderedDict
 from typing import Dict, List
 
@@ -12,20 +12,103 @@ from .configs import configs
 from .base import Base
 from .client import Client
 from .exceptions import MsgError
+from .scheduler import ResponseScheduler, SilenceTracker
+from .delivery import ResponseDispatcher
 
 
 _default_silence_threhold = 180
 _default_silence_threhold_variance = 5
 _default_max_clients_num = 1024     # maximum clients to track
+_default_lock_stripes = 32          # number of per-user lock stripes
+
+
+class _ClientCount:
+    """Number of clients tracked by all the stripes, and the sequence
+    ordering their activity across stripes."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.value = 0
+        self.sequence = itertools.count()
+
+    def add(self, n: int):
+        with self._lock:
+            self.value += n
+
+
+class _ClientShard:
+    """A stripe of the tracked-client table with its own lock.
+
+    The lock also serializes the turns of the users hashed to this stripe.
+    The size of the table is bounded as a whole by Bot, which evicts from
+    the stripes holding the least recently active clients.
+    """
+
+    def __init__(self, count: _ClientCount, silence: SilenceTracker):
+        self.lock = RLock()
+        self.clients = OrderedDict()    # user -> data, least recent first
+        self.count = count
+        self.silence = silence
+        self.inserts = 0
+        self.evictions = 0
+
+    def update(self, user: str, ts: int) -> bool:
+        """Track the activity of user at ts, return True if user is new."""
+        with self.lock:
+            data = self.clients.get(user)
+            inserted = data is None
+            if inserted:
+                data = {"ts": int(time.time()), "initiative": True,
+                        "seq": next(self.count.sequence)}
+                self.clients[user] = data
+                self.inserts += 1
+                self.count.add(1)
+            else:
+                data["ts"] = ts
+                data["seq"] = next(self.count.sequence)
+                self.clients.move_to_end(user)
+
+            if data["initiative"]:
+                self.silence.touch(user, data["ts"])
+        return inserted
+
+    def oldest_seq(self):
+        """Activity sequence of the least recent client, None if empty.
+        Read without the lock, so only a hint."""
+        try:
+            return next(iter(self.clients.values()))["seq"]
+        except (StopIteration, RuntimeError):
+            return None
+
+    def evict_oldest(self) -> bool:
+        """Evict the least recent client, the caller holds the lock."""
+        if not self.clients:
+            return False
+        evicted, _ = self.clients.popitem(last=False)
+        self.silence.discard(evicted)
+        self.evictions += 1
+        self.count.add(-1)
+        return True
+
+    def silence_users(self) -> List[str]:
+        users = self.silence.due()
+        if users:
+            with self.lock:
+                users = [user for user in users if user in self.clients]
+                for user in users:
+                    self.clients[user]["ts"] = int(time.time())
+                    self.clients[user]["initiative"] = False
+                    self.clients[user]["seq"] = next(self.count.sequence)
+                    self.clients.move_to_end(user)
+        return users
 
 
 class Bot:
 
-    _clients = {}
     _silence_threhold = None
     _silence_threhold_variance = None
     _max_clients_num = None
-    _responses = dict()
+    _lock_stripes = None
 
     def __init__(self, configs_path: str, ner, intent_classifiers: dict):
         """
@@ -34,7 +117,13 @@ class Bot:
         ----------
         configs_path: absolute path of the config file.
         """
-        self._lock = RLock()
+        self._clients_count = _ClientCount()
+        self._shards = [
+            _ClientShard(self._clients_count,
+                         SilenceTracker(self._silence_threhold,
+                                        self._silence_threhold_variance))
+            for _ in range(self._lock_stripes)]
+        self._responses = ResponseScheduler()
         self._ner = ner
         self._intent_classifiers = intent_classifiers
 
@@ -66,6 +155,13 @@ class Bot:
             else:
                 cls._max_clients_num = int(cls._max_clients_num)
 
+        if cls._lock_stripes is None:
+            cls._lock_stripes = configs.get("Bot", "lock_stripes")
+            if not cls._lock_stripes:
+                cls._lock_stripes = _default_lock_stripes
+            else:
+                cls._lock_stripes = max(int(cls._lock_stripes), 1)
+
         return super().__new__(cls)
 
     def respond(self, msg: dict):
@@ -82,17 +178,16 @@ class Bot:
 
         customer = msg.get("customer", "common")
 
-        client = Client(msg, self._ner, self._intent_classifiers[customer])
-        with self._lock:
+        # turns of the same user are serialized by the lock of its stripe,
+        # while users of different stripes proceed in parallel
+        with self._shard(msg["user"]).lock:
+            client = Client(msg, self._ner, self._intent_classifiers[customer])
+            now = time.time()
             for response in client.respond():
-                timestamp = int(time.time()) + response.delay
-                if timestamp not in self._responses:
-                    self._responses[timestamp] = [response]
-                else:
-                    self._responses[timestamp].append(response)
+                self._responses.push(response, response.delay, now)
 
-        self._update(client)
-        client.save()
+            self._update(client)
+            client.save()
 
     def initiative_response_checking(self) -> List[str]:
         """
@@ -113,21 +208,8 @@ class Bot:
     def _silence_users(self) -> List[str]:
         """Find users have been silent for a long time."""
         users = []
-        for user, data in self._clients.items():
-            initiative = data.get("initiative", True)
-            if initiative:
-                ts = data.get("ts", 0)
-                if time.time() - ts > self._silence_threhold - int(
-                        random.normalvariate(
-                            0, self._silence_threhold_variance)):
-                    users.append(user)
-
-        if users:
-            with self._lock:
-                for user in users:
-                    self._clients[user]["ts"] = int(time.time())
-                    self._clients[user]["initiative"] = False
-
+        for shard in self._shards:
+            users += shard.silence_users()
         return users
 
     def actively_respond(self, user: str):
@@ -147,30 +229,68 @@ class Bot:
                 msg["initiative"] = True
                 self.respond(msg)
 
+    def actively_respond_many(self, users: List[str]):
+        """Actively respond to the silent users, fetching all their cached
+        msgs from storage at once."""
+        caches = Base.get_caches_by_ids(users)
+        for user in users:
+            msg = caches.get(user, {}).get("msg", {})
+            if msg:
+                msg["text"] = ""
+                msg["initiative"] = True
+                self.respond(msg)
+
     def get_responses(self):
-        responses = []
-        if self._responses:
-            with self._lock:
-                for key in [k for k in self._responses if k < int(time.time())]:
-                    responses += self._responses.pop(key)
+        """Pop the responses which are due now."""
+        return self._responses.pop_due()
+
+    def dispatcher(self, route_key: str="platform") -> ResponseDispatcher:
+        """Create a dispatcher pushing the due responses of this bot to
+        sinks, as an alternative to polling get_responses()."""
+        return ResponseDispatcher(self._responses, route_key)
+
+    def cancel_responses(self, user: str) -> int:
+        """Cancel all pending responses of user, return the number cancelled."""
+        return self._responses.cancel(user)
+
+    def responses_stats(self) -> dict:
+        """Depth of the pending responses queue and age of the oldest one."""
+        return self._responses.stats()
 
-        return responses
+    def clients_stats(self) -> dict:
+        """Size of the tracked-client table and its LRU eviction counters."""
+        return {"clients": self._clients_count.value,
+                "max_clients": self._max_clients_num,
+                "inserts": sum(shard.inserts for shard in self._shards),
+                "evictions": sum(shard.evictions for shard in self._shards)}
+
+    def _shard(self, user: str) -> _ClientShard:
+        return self._shards[hash(user) % len(self._shards)]
 
     def _update(self, client: Client):
-        with self._lock:
-            while len(self._clients) > self._max_clients_num:
-                users = [(user, self._clients[user].get("ts", 0))
-                         for user in self._clients]
-                users = sorted(users, key=lambda x: x[1], reverse=True)
-                del_users = [data[0] for data in users][self._max_clients_num:]
-                with self._lock:
-                    for user in del_users:
-                        del self._clients[user]
-
-            user = client.id
-            if user not in self._clients:
-                self._clients[user] = {"ts": int(time.time()),
-                                       "initiative": True}
-            else:
-                self._clients[client.id]["ts"] = client.state().get(
-                    "timestamp", int(time.time()))
+        if self._shard(client.id).update(
+                client.id, client.state().get("timestamp", int(time.time()))):
+            while self._clients_count.value > self._max_clients_num:
+                if not self._evict_oldest():
+                    break
+
+    def _evict_oldest(self) -> bool:
+        """Evict the least recent client of the stripe whose least recent
+        client is the oldest, i.e. the least recent client overall but for
+        races. Stripes locked by other turns are skipped rather than waited
+        for, so stripes never wait for each other; when all are, the table
+        exceeds the cap until the next new client."""
+        candidates = []
+        for shard in self._shards:
+            seq = shard.oldest_seq()
+            if seq is not None:
+                candidates.append((seq, shard))
+        candidates.sort(key=lambda candidate: candidate[0])
+        for _, shard in candidates:
+            if shard.lock.acquire(blocking=False):
+                try:
+                    if shard.evict_oldest():
+                        return True
+                finally:
+                    shard.lock.release()
+        return False
@@ -26,19 +26,38 @@ def _custom_class_grounding() -> Type[Grounding]:
                          root_path=configs.get("Root", "root_path"))
 
 
+# 0 to keep all of the previous topics. The values of a client are stored as
+# one entry, so previous_topics is serialized in full on every save: the
+# cost of a turn grows with this bound.
+_default_max_previous_topics = 20
+
+
 class Client(Base):
 
+    __slots__ = ("_msg", "_previous_topics", "_topics_summary", "_context",
+                 "_grounding", "_topics", "_ner", "_intent_classifier",
+                 "_dialog")
+
     _attrs = [
         "id",                  # Client instance id
         "msg",                 # User message
         "previous_topics",     # Topic status list of previous Topic instances
         "context",             # Context of the conversation
-        "grounding"            # The conversation grounding
+        "grounding",           # The conversation grounding
+        "topics_summary"       # Summary of topics trimmed from previous_topics
     ]
+    # every turn reads the context, grounding and previous topics, so only
+    # msg, replaced by the message of the turn, and topics_summary, only
+    # read when previous topics are trimmed, are hydrated lazily: saving
+    # passes the restored summary through untouched
+    _lazy_restore = ("msg", "topics_summary")
     _class_context = None
     _class_grounding = None
+    _max_previous_topics = None
+    _summarize_previous_topics = None
 
-    def __init__(self, msg: dict, ner, intent_classifier):
+    def __init__(self, msg: dict, ner, intent_classifier, cache: dict=None,
+                 parse: bool=True):
         """
 
         Parameters
@@ -57,23 +76,38 @@ class Client(Base):
             ]
         intent_classifier: instance of intent classifier which has method
             predict(text, context) to predict user's intent.
+        cache: client data already read from storage, see Base.__init__.
+        parse: parse the dialog and select topics at once. If False,
+            async_parse() has to be awaited before respond().
         """
         self._previous_topics = None
+        self._topics_summary = None
         self._context = None
         self._grounding = None
         self._topics = OrderedDict()
-        super().__init__(msg["user"])
-        self._msg = msg
+        super().__init__(msg["user"], cache)
+        self.msg = msg
         self._ner = ner
         self._intent_classifier = intent_classifier
         self._dialog = None
-        self._update(msg)
+        self._update(msg, parse)
 
     def __new__(cls, *args, **kwargs):
         if cls._class_context is None:
             cls._class_context = _custom_class_context()
         if cls._class_grounding is None:
             cls._class_grounding = _custom_class_grounding()
+        if cls._max_previous_topics is None:
+            cls._max_previous_topics = configs.get("Client",
+                                                   "max_previous_topics")
+            if not cls._max_previous_topics:
+                cls._max_previous_topics = _default_max_previous_topics
+            else:
+                cls._max_previous_topics = int(cls._max_previous_topics)
+        if cls._summarize_previous_topics is None:
+            cls._summarize_previous_topics = configs.get(
+                "Client", "summarize_previous_topics").lower() not in \
+                ("0", "false", "no", "off")
         return super().__new__(cls)
 
     @property
@@ -96,6 +130,16 @@ class Client(Base):
         """
         self._previous_topics = items
 
+    @property
+    def topics_summary(self) -> dict:
+        """Summary of the topics trimmed from previous_topics:
+        {"turns": int, "topics": {topic name: turns}}"""
+        return self._topics_summary
+
+    @topics_summary.setter
+    def topics_summary(self, summary: dict):
+        self._topics_summary = summary
+
     @property
     def context(self):
         return self._context
@@ -159,39 +203,70 @@ class Client(Base):
         }
 
     def _update_previous_topics(self, topics: OrderedDict):
+        """Append topics to previous_topics, keeping the most recent
+        max_previous_topics only."""
         if topics:
             self._previous_topics.append(topics)
-
-    def _update(self, msg: dict):
+            overflow = len(self._previous_topics) - self._max_previous_topics
+            if self._max_previous_topics > 0 and overflow > 0:
+                if self._summarize_previous_topics:
+                    self._summarize_topics(self._previous_topics[:overflow])
+                del self._previous_topics[:overflow]
+
+    def _summarize_topics(self, previous_topics: list):
+        summary = self.topics_summary
+        if summary is None:
+            summary = {"turns": 0, "topics": {}}
+        counts = summary["topics"]
+        for topics in previous_topics:
+            summary["turns"] += 1
+            for topic in topics.values():
+                name = str(topic)
+                counts[name] = counts.get(name, 0) + 1
+        self.topics_summary = summary
+
+    async def async_parse(self, executor=None):
+        """Parse the dialog with awaitable or executor-run models, then
+        select topics."""
+        await self._dialog.async_parse(self._ner, self._intent_classifier,
+                                       executor)
+        self._select_topics(self._msg)
+
+    def _update(self, msg: dict, parse: bool=True):
         """
         Update client data(dialog, context, grounding, previous_topics)
         with input message from user.
         """
-        if self._previous_topics is None:
+        if self.previous_topics is None:
             self._previous_topics = []
 
-        if self._context is None:
+        if self.context is None:
             self._context = self._class_context.create_instance_from_msg(msg)
         else:
             self._context.consume(msg)
 
-        if self._grounding is None:
+        if self.grounding is None:
             self._grounding = self._class_grounding()
 
         self._dialog = Dialog(msg, self.context, self.grounding)
-        self._dialog.parse(self._ner, self._intent_classifier)
+        if parse:
+            self._dialog.parse(self._ner, self._intent_classifier)
+            self._select_topics(msg)
 
-        customer = msg["customer"]
+    def _select_topics(self, msg: dict):
+        customer = msg.get("customer", "common")
         if self._need_change_topic():
             self._grounding.update(self._context)
             self._context.update(self._dialog)
-            self._topics = TopicFactory().create_topic(self._dialog.intent_labels)
+            self._topics = TopicFactory().create_topic(
+                self._dialog.intent_labels, customer=customer)
         else:
             self._context.update(self._dialog)
             last_topic = self._previous_topics.popitem()
             topic_id = last_topic[0]
             topic_name = last_topic[1][-1]
-            self._topics = TopicFactory().create_topic([topic_name], topic_id)
+            self._topics = TopicFactory().create_topic(
+                [topic_name], topic_id, customer=customer)
 
         # todo update_previous_topics
         self._update_previous_topics(self._topics)
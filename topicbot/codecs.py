@@ -0,0 +1,129 @@
+"""Codecs to serialize the values kept in storage"""
+
+import json
+import zlib
+import marshal
+
+from .configs import configs
+from .utils import CustomJSONEncoder, import_module, to_plain
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_default_compress_threshold = 1024  # bytes, 0 to never compress
+
+
+class Codec:
+    """Base class of storage codecs"""
+
+    def encode(self, value: dict):
+        raise NotImplementedError
+
+    def decode(self, data) -> dict:
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """JSON text, the historical format of storage"""
+
+    def encode(self, value: dict) -> str:
+        return json.dumps(value, cls=CustomJSONEncoder)
+
+    def decode(self, data) -> dict:
+        return json.loads(data)
+
+
+class BinaryCodec(Codec):
+    """Compact binary format with a version header.
+
+    Header: magic b"TB", version byte, flags byte, marshal version byte.
+    The flags tell the payload format, msgpack when it is installed or
+    marshal otherwise, and whether the payload is zlib compressed, which
+    happens above compress_threshold bytes. Data without the header is
+    decoded as JSON, so storage written by JSONCodec stays readable.
+
+    Values are serialized as they are, with to_plain only called for the
+    objects msgpack or marshal do not know. msgpack does so in its default
+    hook, leaf by leaf; marshal has no such hook, so values holding objects
+    go through to_plain in full, which makes encoding slower than JSON.
+    msgpack is therefore listed in requirements.txt.
+
+    The marshal format changes between Python versions, so the
+    marshal.version of the writer is recorded and data written by a newer
+    one is refused; a storage shared by processes of several Python
+    versions should install msgpack. Like pickle, marshal must only be used
+    with a trusted storage.
+    """
+
+    MAGIC = b"TB"
+    VERSION = 2     # version 1 had no marshal version byte
+
+    FORMAT_MARSHAL = 0x00
+    FORMAT_MSGPACK = 0x01
+    FORMAT_MASK = 0x0f
+    COMPRESSED = 0x80
+
+    def __init__(self, compress_threshold: int=None):
+        if compress_threshold is None:
+            compress_threshold = configs.get("Codec", "compress_threshold") \
+                if configs.has_loaded() else ""
+            compress_threshold = int(compress_threshold) \
+                if compress_threshold else _default_compress_threshold
+        self._compress_threshold = compress_threshold
+        self._format = self.FORMAT_MSGPACK if msgpack else self.FORMAT_MARSHAL
+
+    def encode(self, value: dict) -> bytes:
+        # only the values msgpack or marshal cannot serialize themselves
+        # are converted by to_plain
+        if self._format == self.FORMAT_MSGPACK:
+            payload = msgpack.packb(value, use_bin_type=True,
+                                    default=to_plain)
+        else:
+            try:
+                payload = marshal.dumps(value)
+            except ValueError:
+                payload = marshal.dumps(to_plain(value))
+
+        flags = self._format
+        if 0 < self._compress_threshold < len(payload):
+            payload = zlib.compress(payload, 1)
+            flags |= self.COMPRESSED
+        return self.MAGIC + bytes((self.VERSION, flags, marshal.version)) + \
+            payload
+
+    def decode(self, data) -> dict:
+        if isinstance(data, str) or data[:2] != self.MAGIC:
+            return json.loads(data)
+
+        version, flags = data[2], data[3]
+        if version == self.VERSION:
+            marshal_version = data[4]
+            payload = data[5:]
+        elif version == 1:
+            marshal_version = None
+            payload = data[4:]
+        else:
+            raise ValueError("Unsupported codec version %d" % version)
+        if flags & self.COMPRESSED:
+            payload = zlib.decompress(payload)
+
+        if flags & self.FORMAT_MASK == self.FORMAT_MSGPACK:
+            if msgpack is None:
+                raise ImportError("msgpack is required to decode the data")
+            return msgpack.unpackb(payload, raw=False)
+        if marshal_version is not None and marshal_version > marshal.version:
+            raise ValueError("Data written with marshal version %d, newer "
+                             "than %d" % (marshal_version, marshal.version))
+        return marshal.loads(payload)
+
+
+def get_codec() -> Codec:
+    """Codec set by [Base] codec in configs, JSONCodec by default."""
+    path = configs.get("Base", "codec") if configs.has_loaded() else ""
+    if not path:
+        return JSONCodec()
+    return import_module(module_path=path,
+                         root_path=configs.get("Root", "root_path"))()
@@ -15,6 +15,8 @@ class Context:
     2. Update dialog to create data from dialog's parsed data.
     """
 
+    __slots__ = ("_data",)
+
     def __init__(self, data: dict=None):
         self._data = data if data else {}
 
@@ -0,0 +1,137 @@
+"""Push-based delivery of the due responses to sinks"""
+
+import time
+import logging
+
+from threading import Thread, Lock
+from collections import OrderedDict
+from typing import Callable, List, Union
+
+from .response import Response
+from .scheduler import ResponseScheduler
+
+
+_max_wait = 1.0     # seconds, bound the sleep so stop() is never missed
+
+
+class ResponseDispatcher:
+    """Thread which sleeps until the next response falls due, and pushes
+    the due responses to the registered sinks.
+
+    A sink is either a callable, called with the list of responses falling
+    due at the same moment, or a queue-like object with put(), which gets
+    the responses one by one. Sinks are chosen by the route_key field of
+    Response.msg_data (e.g. "platform"); sinks registered without a route
+    receive the responses no routed sink matches.
+    """
+
+    def __init__(self, scheduler: ResponseScheduler, route_key: str="platform"):
+        self._scheduler = scheduler
+        self._route_key = route_key
+        self._sinks = dict()        # route -> list of sinks, None is default
+        self._thread = None
+        self._running = False
+        self._stats_lock = Lock()
+        self._delivered = 0
+        self._batches = 0
+        self._errors = 0
+        self._undeliverable = 0
+        self._lateness_total = 0.0
+        self._lateness_max = 0.0
+
+    def add_sink(self, sink: Union[Callable[[List[Response]], None], object],
+                 route: str=None):
+        """Register sink for responses whose msg_data[route_key] is route,
+        or as a default sink if route is None."""
+        self._sinks.setdefault(route, []).append(sink)
+
+    def remove_sink(self, sink, route: str=None):
+        sinks = self._sinks.get(route, [])
+        if sink in sinks:
+            sinks.remove(sink)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = Thread(target=self._run, name="ResponseDispatcher",
+                              daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float=None):
+        """Stop the delivery thread, responses not yet due stay pending."""
+        self._running = False
+        self._scheduler.wakeup()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def deliver_due(self, now: float=None) -> int:
+        """Deliver the responses due at now, return the number delivered."""
+        if now is None:
+            now = time.time()
+        items = self._scheduler.pop_due_items(now)
+        if not items:
+            return 0
+
+        batches = OrderedDict()
+        lateness_total = 0.0
+        lateness_max = 0.0
+        for due, response in items:
+            lateness = max(now - due, 0.0)
+            lateness_total += lateness
+            lateness_max = max(lateness_max, lateness)
+            route = response.msg_data.get(self._route_key)
+            if route not in self._sinks:
+                route = None
+            batches.setdefault(route, []).append(response)
+
+        errors = 0
+        undeliverable = 0
+        for route, batch in batches.items():
+            sinks = self._sinks.get(route)
+            if not sinks:
+                undeliverable += len(batch)
+                logging.error("No sink for %d responses of route %s" %
+                              (len(batch), route))
+                continue
+            for sink in sinks:
+                try:
+                    if hasattr(sink, "put"):
+                        for response in batch:
+                            sink.put(response)
+                    else:
+                        sink(batch)
+                except Exception:
+                    errors += 1
+                    logging.exception("Failed to deliver responses to %r" %
+                                      sink)
+
+        with self._stats_lock:
+            self._delivered += len(items) - undeliverable
+            self._batches += 1
+            self._errors += errors
+            self._undeliverable += undeliverable
+            self._lateness_total += lateness_total
+            self._lateness_max = max(self._lateness_max, lateness_max)
+        return len(items) - undeliverable
+
+    def stats(self) -> dict:
+        """Delivery counters and the lateness of responses in seconds, i.e.
+        how long after their due time they were delivered."""
+        with self._stats_lock:
+            count = self._delivered + self._undeliverable
+            return {
+                "delivered": self._delivered,
+                "batches": self._batches,
+                "errors": self._errors,
+                "undeliverable": self._undeliverable,
+                "lateness_avg": self._lateness_total / count if count else 0.0,
+                "lateness_max": self._lateness_max,
+                "pending": len(self._scheduler)
+            }
+
+    def _run(self):
+        while self._running:
+            if not self.deliver_due():
+                self._scheduler.wait(_max_wait)
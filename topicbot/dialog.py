@@ -8,12 +8,14 @@ from typing import List, Tuple, Union
 
 from .base import Base
 from .response import ResponseFactory
-from .utils import create_template
+from .utils import create_template, call_async
 from .configs import configs
 
 
 class Dialog(Base):
 
+    __slots__ = ("_msg", "_context", "_grounding", "_response", "_parsed_data")
+
     _attrs = [
         "id",              # str, instance identifier
         "msg",             # dict, client msg
@@ -44,11 +46,11 @@ class Dialog(Base):
         if parsed_value:
             return parsed_value
 
-        context_value = self._context[key]
+        context_value = self._context.get(key)
         if context_value:
             return context_value
 
-        grounding_value = self._grounding[key]
+        grounding_value = self._grounding.get(key)
         if grounding_value:
             return grounding_value
 
@@ -119,3 +121,25 @@ class Dialog(Base):
                              "template": template,
                              "entities": entities,
                              "intent_labels": intent_labels}
+
+    async def async_parse(self, ner, intent_classifier, executor=None):
+        """
+        Awaitable parse. Coroutine ner.ner and intent_classifier.predict are
+        awaited, sync-only ones are run in the executor.
+        """
+        if self._msg.get("initiative", False):
+            self.parse(ner, intent_classifier)
+            return
+
+        text = self._msg.get("text", "")
+        entities = sorted(await call_async(ner.ner, text, executor=executor),
+                          key=lambda x: x["start"])
+        template = create_template(entities)
+        intent_labels = await call_async(intent_classifier.predict, template,
+                                         self._merged_context(),
+                                         executor=executor)
+
+        self._parsed_data = {"text": text,
+                             "template": template,
+                             "entities": entities,
+                             "intent_labels": intent_labels}
@@ -13,3 +13,12 @@ class MsgError(Exception):
     def __init__(self):
         err = "The user input message field error!"
         super().__init__(err)
+
+
+class KeyExpiredError(KeyError):
+    """Raised by storage when the key was found but has expired. Being a
+    KeyError, callers not interested in the difference are unaffected."""
+
+
+class TopicDefinitionError(Exception):
+    """Raised when loading a Topic whose intent_maps() is invalid."""
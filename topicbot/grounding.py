@@ -7,6 +7,8 @@ from .context import Context
 
 class Grounding:
 
+    __slots__ = ("_data",)
+
     def __init__(self, data: dict=None):
         self._data = data if data else {}
 
@@ -0,0 +1,127 @@
+"""Histograms and a Prometheus text exporter for runtime metrics"""
+
+import bisect
+
+from threading import Lock, Thread
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Sequence
+
+
+# seconds
+default_latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# bytes
+default_size_buckets = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets, with their sum.
+
+    Buckets are the sorted upper bounds, an implicit +Inf bucket takes the
+    values above the last one. Observing only increments one counter, so
+    it is cheap enough for every storage operation.
+    """
+
+    def __init__(self, buckets: Sequence[float]=default_latency_buckets):
+        self._bounds = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """Cumulative counts of each upper bound, as in Prometheus, with
+        the total count and sum."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        buckets = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float("inf"),), counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {"buckets": buckets, "count": cumulative, "sum": total}
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile, 0 if empty."""
+        snapshot = self.snapshot()
+        rank = q * snapshot["count"]
+        for bound, cumulative in snapshot["buckets"]:
+            if cumulative and cumulative >= rank:
+                return bound
+        return 0.0
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\")
+                     .replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in sorted(labels.items()))
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(metrics: list) -> str:
+    """Render metrics in the Prometheus text exposition format.
+
+    :param metrics: list of (name, type, help, samples), where type is
+        "counter", "gauge" or "histogram" and samples is a list of
+        (labels dict, value), value being a Histogram.snapshot() for
+        histograms.
+    """
+    lines = []
+    for name, type_, help_, samples in metrics:
+        lines.append("# HELP %s %s" % (name, help_))
+        lines.append("# TYPE %s %s" % (name, type_))
+        for labels, value in samples:
+            if type_ != "histogram":
+                lines.append("%s%s %s" % (name, _labels(labels),
+                                          _number(value)))
+                continue
+            for bound, cumulative in value["buckets"]:
+                le = dict(labels, le=_number(bound))
+                lines.append("%s_bucket%s %d" % (name, _labels(le),
+                                                 cumulative))
+            lines.append("%s_sum%s %s" % (name, _labels(labels),
+                                          _number(value["sum"])))
+            lines.append("%s_count%s %d" % (name, _labels(labels),
+                                            value["count"]))
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(render: Callable[[], str], port: int,
+                     address: str="") -> ThreadingHTTPServer:
+    """Serve the text returned by render on every GET, from a daemon thread.
+
+    Nothing but the standard library is needed, call shutdown() on the
+    returned server to stop it.
+    """
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    Thread(target=server.serve_forever, name="PrometheusExporter",
+           daemon=True).start()
+    return server
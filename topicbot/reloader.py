@@ -0,0 +1,101 @@
+"""Reloading of the module files changed on disk"""
+
+import os
+import stat
+import logging
+
+from threading import Event, Thread, current_thread
+from collections import OrderedDict, namedtuple
+from typing import Callable, Dict, List
+
+
+Changes = namedtuple("Changes", ["loaded", "stale", "files", "changed",
+                                 "removed", "failed"])
+
+
+def scan_files(paths: List[str]) -> Dict[str, list]:
+    """[mtime_ns, size] of each .py file directly in the folders of paths."""
+    files = OrderedDict()
+    for path in paths:
+        for f in sorted(os.listdir(path)):
+            if not f.endswith(".py"):
+                continue
+            sub_path = os.path.join(path, f)
+            st = os.stat(sub_path)
+            if stat.S_ISREG(st.st_mode):
+                files[sub_path] = [st.st_mtime_ns, st.st_size]
+    return files
+
+
+def reload_files(known: dict, files: dict,
+                 load: Callable[[str], dict]) -> Changes:
+    """Load the files added or modified since known was recorded.
+
+    :param known: path -> (stamp, names loaded from the file) as recorded.
+    :param files: path -> stamp as scanned now.
+    :param load: function loading a file, returning the loaded objects by
+        name.
+    :return: None if no file changed. Otherwise the objects loaded from the
+        changed files, the names to drop, i.e. those loaded before from the
+        changed or removed files, the new path -> (stamp, names), and the
+        paths of the changed, removed and failed files. The names of a file
+        failing to load are kept until it is fixed.
+    """
+    changed = [path for path, stamp in files.items()
+               if path not in known or known[path][0] != stamp]
+    removed = [path for path in known if path not in files]
+    if not changed and not removed:
+        return None
+
+    stale = set()
+    loaded = {}
+    failed = set()
+    files_names = dict(known)
+    for path in removed:
+        stale.update(known[path][1])
+        del files_names[path]
+    for path in changed:
+        try:
+            objects = load(path)
+        except Exception:
+            logging.exception("Failed to reload %s", path)
+            failed.add(path)
+            files_names[path] = (files[path], known.get(path, (None, []))[1])
+            continue
+        if path in known:
+            stale.update(known[path][1])
+        loaded.update(objects)
+        files_names[path] = (files[path], list(objects))
+    return Changes(loaded, stale, files_names, changed, removed, failed)
+
+
+class Reloader:
+    """Daemon thread calling reload every interval seconds until stop()."""
+
+    def __init__(self, reload: Callable[[], list], interval: float,
+                 name: str="Reloader"):
+        self._reload = reload
+        self._interval = interval
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive() and not self._stopped.is_set()
+
+    def start(self) -> "Reloader":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float=None):
+        """Stop polling, and wait for a reload in progress to end."""
+        self._stopped.set()
+        if self._thread.is_alive() and current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._reload()
+            except Exception:
+                logging.exception("%s failed to reload", self._thread.name)
@@ -3,12 +3,15 @@
 import os
 import json
 import random
+import logging
 import inspect
 import importlib.util
 
 from inspect import isclass
+from threading import RLock
 
 from .configs import configs
+from .reloader import Reloader, reload_files, scan_files
 from topicbot.utils import singleton
 
 
@@ -71,6 +74,10 @@ class Response:
     def user(self):
         return self._msg_data["user"]
 
+    @property
+    def msg_data(self) -> dict:
+        return self._msg_data
+
     def template(self) -> dict:
         """A empty response values to be filled with real data
         to create a response values."""
@@ -80,35 +87,101 @@ class Response:
         raise NotImplementedError
 
 
+def _import_responses(path: str) -> dict:
+    """Execute the module file at path and collect its Response subclasses
+    by protocol."""
+    responses = {}
+    module_spec = importlib.util.spec_from_file_location(
+        os.path.basename(path), path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+
+    for attr, _ in inspect.getmembers(module):
+        memb = getattr(module, attr)
+        if isclass(memb) and issubclass(memb, Response):
+            try:
+                responses[memb.protocol] = memb
+            except NotImplementedError:
+                continue
+    return responses
+
+
 @singleton
 class ResponseFactory:
+    """Create responses by protocol from the Response subclasses of
+    [Responses] response_path.
+
+    reload() re-imports the files changed since they were loaded, polled
+    every [Responses] reload_interval seconds if set, and swaps in the
+    updated protocols at once.
+    """
 
     def __init__(self):
         self._responses = None
+        self._files = dict()    # file path -> ([mtime_ns, size], protocols)
+        self._reload_lock = RLock()
+        self._reloader = None
+
+    def _scan(self) -> dict:
+        """[mtime_ns, size] of each response file."""
+        path = configs.get("Responses", "response_path")
+        return scan_files([path]) if os.path.isdir(path) else {}
 
     def _load_responses(self):
         responses = {}
-        path = configs.get("Responses", "response_path")
-        if os.path.isdir(path):
-            for f in os.listdir(path):
-
-                if not f.endswith(".py"):
-                    continue
-
-                module_spec = importlib.util.spec_from_file_location(
-                    f, os.path.join(path, f))
-                module = importlib.util.module_from_spec(module_spec)
-                module_spec.loader.exec_module(module)
-
-                for attr, _ in inspect.getmembers(module):
-                    memb = getattr(module, attr)
-                    if isclass(memb) and issubclass(memb, Response):
-                        try:
-                            responses[memb.protocol] = memb
-                        except NotImplementedError:
-                            continue
+        with self._reload_lock:
+            files = dict()
+            for path, stamp in self._scan().items():
+                loaded = _import_responses(path)
+                responses.update(loaded)
+                files[path] = (stamp, list(loaded))
+            self._files = files
+
+        reload_interval = configs.get("Responses", "reload_interval")
+        if reload_interval and float(reload_interval) > 0 and \
+                self._reloader is None:
+            self.start_reloader(float(reload_interval))
         return responses
 
+    def reload(self) -> list:
+        """Re-import the response files added or modified since they were
+        loaded, drop the protocols of the removed ones, and swap in the
+        updated protocols at once.
+
+        :return: paths of the changed files.
+        """
+        if self._responses is None:
+            return []
+        with self._reload_lock:
+            files = self._scan()
+            changes = reload_files(self._files, files, _import_responses)
+            if changes is None:
+                return []
+
+            responses = {protocol: response for protocol, response in
+                         self._responses.items()
+                         if protocol not in changes.stale}
+            responses.update(changes.loaded)
+            self._responses = responses
+            self._files = changes.files
+
+        logging.info("Reloaded responses of %d changed and %d removed files",
+                     len(changes.changed), len(changes.removed))
+        return changes.changed + changes.removed
+
+    def start_reloader(self, interval: float):
+        """Start a daemon thread calling reload() every interval seconds,
+        instead of the one started before if any."""
+        self.stop_reloader()
+        self._reloader = Reloader(self.reload, interval,
+                                  "ResponseReloader").start()
+
+    def stop_reloader(self, timeout: float=None):
+        """Stop the thread started by start_reloader()."""
+        if self._reloader is not None:
+            self._reloader.stop(timeout)
+            self._reloader = None
+
     def create_response(self, response_data: dict, additional_msg: dict) -> Response:
         """Create Response instance according to response data and response msg.
 
@@ -0,0 +1,194 @@
+"""Schedulers for the pending responses and silent users of the bot"""
+
+import time
+import heapq
+import random
+import itertools
+
+from threading import Lock, Condition
+from typing import List, Tuple
+
+
+class ResponseScheduler:
+    """Min-heap of pending responses ordered by their due time.
+
+    Entries are kept in a heap of [due, seq, response] lists, so popping the
+    k due responses costs O(k log n). Cancelled entries are only marked and
+    dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._lock = Condition(Lock())
+        self._heap = []
+        self._entries = dict()      # seq -> (entry, scheduled time), FIFO
+        self._users = dict()        # user -> set of seq
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def push(self, response, delay: float=0, now: float=None):
+        """Schedule response to be due after delay seconds."""
+        if now is None:
+            now = time.time()
+        seq = next(self._counter)
+        entry = [now + max(delay or 0, 0), seq, response]
+        with self._lock:
+            heapq.heappush(self._heap, entry)
+            self._entries[seq] = (entry, now)
+            self._users.setdefault(response.user, set()).add(seq)
+            if self._heap[0] is entry:
+                # due earlier than what waiters are sleeping for
+                self._lock.notify_all()
+
+    def pop_due(self, now: float=None) -> List:
+        """Pop all responses which are due at now, in order of due time."""
+        return [response for _, response in self.pop_due_items(now)]
+
+    def pop_due_items(self, now: float=None) -> List[Tuple[float, object]]:
+        """Pop all (due time, response) which are due at now, in order of
+        due time."""
+        if now is None:
+            now = time.time()
+        items = []
+        if not self._heap or self._heap[0][0] > now:
+            return items
+
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                due, seq, response = heapq.heappop(heap)
+                if response is None:
+                    continue
+                del self._entries[seq]
+                seqs = self._users[response.user]
+                seqs.discard(seq)
+                if not seqs:
+                    del self._users[response.user]
+                items.append((due, response))
+        return items
+
+    def cancel(self, user: str) -> int:
+        """Cancel all pending responses of user, return the number cancelled."""
+        with self._lock:
+            seqs = self._users.pop(user, ())
+            for seq in seqs:
+                entry, _ = self._entries.pop(seq)
+                entry[2] = None
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                # too many cancelled entries, compact the heap
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+        return len(seqs)
+
+    def next_due(self) -> float:
+        """Due time of the earliest pending response, or None if empty."""
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][2] is None:
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def wait(self, timeout: float=None):
+        """Block until the earliest pending response is due, a response due
+        earlier is pushed, wakeup() is called, or timeout."""
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][2] is None:
+                heapq.heappop(heap)
+            if heap:
+                delay = heap[0][0] - time.time()
+                if delay <= 0:
+                    return
+                timeout = delay if timeout is None else min(timeout, delay)
+            self._lock.wait(timeout)
+
+    def wakeup(self):
+        """Wake up the threads blocked in wait()."""
+        with self._lock:
+            self._lock.notify_all()
+
+    def oldest_age(self, now: float=None) -> float:
+        """Seconds the oldest pending response has been waiting."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            for _, scheduled in self._entries.values():
+                return now - scheduled
+        return 0.0
+
+    def stats(self) -> dict:
+        return {"pending": len(self), "oldest_age": self.oldest_age()}
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._entries = dict()
+            self._users = dict()
+
+
+class SilenceTracker:
+    """Index of users ordered by the deadline of their silence.
+
+    The jittered deadline is drawn once when a user is touched, and users are
+    kept in a heap of (deadline, user) tuples, so checking costs O(k log n)
+    for the k users due. Outdated heap entries are skipped lazily.
+    """
+
+    def __init__(self, threshold: float, variance: float=0):
+        self._threshold = threshold
+        self._variance = variance
+        self._lock = Lock()
+        self._heap = []
+        self._deadlines = dict()    # user -> deadline
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, user: str) -> bool:
+        return user in self._deadlines
+
+    def touch(self, user: str, ts: float=None):
+        """(Re)schedule the silence deadline of user after activity at ts."""
+        if ts is None:
+            ts = time.time()
+        deadline = ts + self._threshold - int(
+            random.normalvariate(0, self._variance))
+        with self._lock:
+            self._deadlines[user] = deadline
+            heapq.heappush(self._heap, (deadline, user))
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._compact()
+
+    def discard(self, user: str):
+        """Stop tracking user."""
+        with self._lock:
+            self._deadlines.pop(user, None)
+
+    def due(self, now: float=None) -> List[str]:
+        """Pop the users whose silence deadline has passed."""
+        if now is None:
+            now = time.time()
+        users = []
+        if not self._heap or self._heap[0][0] >= now:
+            return users
+
+        with self._lock:
+            heap = self._heap
+            deadlines = self._deadlines
+            while heap and heap[0][0] < now:
+                deadline, user = heapq.heappop(heap)
+                if deadlines.get(user) == deadline:
+                    del deadlines[user]
+                    users.append(user)
+        return users
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._deadlines = dict()
+
+    def _compact(self):
+        self._heap = [(deadline, user)
+                      for user, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
@@ -1,24 +1,82 @@
 """Storage for multi-rounds dialogue data"""
 
+import re
 import time
-import json
+import uuid
+import heapq
+import atexit
+import marshal
+import signal
+import logging
+import sqlite3
 
 import redis
+import redis.asyncio
 
-from threading import RLock
+from threading import RLock, Lock, Condition, Thread
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from topicbot.utils import singleton
-from .utils import CustomJSONEncoder
+from .configs import configs
+from .codecs import Codec, get_codec
+from .exceptions import KeyExpiredError
+from .metrics import (Histogram, default_latency_buckets,
+                      default_size_buckets, prometheus_text)
+from .utils import call_async, import_module, to_plain
+
+
+_default_flush_interval = 0.5   # seconds between write-behind flushes
+_default_flush_batch_size = 100
+_default_max_pending = 10000    # dirty keys before add() flushes by itself
+_default_ttl = 3600
+_default_redis_url = "redis://localhost:6379/0"
+_default_redis_prefix = "TopicChat#"
+_redis_batch_size = 500
+_expire_batch_size = 16         # expired entries removed per add
+_default_memory_shards = 16
+_default_sqlite_path = "topicbot.sqlite3"
+_default_purge_interval = 60    # seconds between purges of expired rows
+_sqlite_batch_size = 500        # keys per query of get_many
+_default_l1_entries = 10000
+_default_size_sample = 10       # measure the size of one in so many values
+
+_redis_pools = dict()           # url -> redis.ConnectionPool
+_redis_pools_lock = Lock()
+
+
+def _config_value(section: str, option: str, default, type_=int):
+    value = configs.get(section, option) if configs.has_loaded() else ""
+    return type_(value) if value else default
+
+
+def _redis_pool(url: str) -> redis.ConnectionPool:
+    """Connection pool of url, shared by all the storages of the process."""
+    with _redis_pools_lock:
+        pool = _redis_pools.get(url)
+        if pool is None:
+            pool = redis.ConnectionPool.from_url(url)
+            _redis_pools[url] = pool
+        return pool
 
 
 class Storage:
     """Base class for cache storage"""
 
-    def __init__(self, ttl: int=3600):
+    def __init__(self, ttl: int=3600, codec: Codec=None):
+        """
+        :param ttl: default seconds to keep the values.
+        :param codec: codec to serialize the values, [Base] codec if None.
+        """
         self._ttl = ttl
+        self._codec = codec if codec is not None else get_codec()
         self._lock = RLock()
         self._store = None
 
+    @property
+    def codec(self) -> Codec:
+        return self._codec
+
     def __contains__(self, item):
         raise NotImplementedError
 
@@ -41,40 +99,180 @@ class Storage:
     def has(self, key: str) -> bool:
         return self.__contains__(key)
 
+    def add_many(self, items: dict, ttl: int=None):
+        """Add all key-values of items. Backends override it to do so in one
+        operation."""
+        for key, value in items.items():
+            self.add(key, value, ttl)
+
+    def delete_many(self, keys: list):
+        """Delete keys."""
+        for key in keys:
+            self.delete(key)
+
+    def get_many(self, keys: list) -> dict:
+        """Get the values of keys, keys not found or expired are left out
+        of the returned dict."""
+        values = dict()
+        for key in keys:
+            try:
+                values[key] = self.get(key)
+            except KeyError:
+                continue
+        return values
+
+    async def aadd(self, key: str, value: dict, ttl: int=None):
+        """Awaitable add, run in the default executor unless overridden."""
+        await call_async(self.add, key, value, ttl)
+
+    async def adelete(self, key: str):
+        """Awaitable delete, run in the default executor unless overridden."""
+        await call_async(self.delete, key)
+
+    async def aget(self, key: str) -> dict:
+        """Awaitable get, run in the default executor unless overridden."""
+        return await call_async(self.get, key)
+
+    async def aadd_many(self, items: dict, ttl: int=None):
+        """Awaitable add_many, run in the default executor unless
+        overridden."""
+        await call_async(self.add_many, items, ttl)
+
+    async def adelete_many(self, keys: list):
+        """Awaitable delete_many, run in the default executor unless
+        overridden."""
+        await call_async(self.delete_many, keys)
+
+    async def aget_many(self, keys: list) -> dict:
+        """Awaitable get_many, run in the default executor unless
+        overridden."""
+        return await call_async(self.get_many, keys)
+
 
 @singleton
 class InMemoryStorage(Storage):
-    """Memory-based implementation."""
+    """Memory-based implementation.
 
-    def __init__(self):
+    Expired entries are removed incrementally, a few on every add and by an
+    optional reaper thread, following a heap of (expire, key) deadlines.
+    When max_entries or max_bytes (approximated by the encoded sizes) is
+    exceeded, the least recently used entries are evicted.
+
+    It is a singleton shared by the whole process: the arguments only apply
+    to the first construction, later ones return that instance whatever
+    they pass. Set them in configs rather than as arguments.
+    """
+
+    def __init__(self, max_entries: int=None, max_bytes: int=None,
+                 reaper_interval: float=None):
+        """
+
+        Parameters
+        ----------
+        max_entries: maximum number of entries, [InMemoryStorage]
+            max_entries if None, 0 for no limit.
+        max_bytes: maximum encoded bytes of the entries, [InMemoryStorage]
+            max_bytes if None, 0 for no limit.
+        reaper_interval: seconds between runs of the reaper thread,
+            [InMemoryStorage] reaper_interval if None, 0 for no reaper.
+        """
         super().__init__()
-        self._store = dict()
+        self._store = OrderedDict()     # key -> encoded, least recent first
         self._expires = dict()
+        self._deadlines = []            # heap of (expire, key)
+        self._bytes = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._max_entries = max_entries if max_entries is not None else \
+            _config_value("InMemoryStorage", "max_entries", 0)
+        self._max_bytes = max_bytes if max_bytes is not None else \
+            _config_value("InMemoryStorage", "max_bytes", 0)
+        if reaper_interval is None:
+            reaper_interval = _config_value("InMemoryStorage",
+                                            "reaper_interval", 0, float)
+        if reaper_interval > 0:
+            self.start_reaper(reaper_interval)
 
     def __contains__(self, key: str) -> bool:
         return key in self._expires
 
+    def __len__(self) -> int:
+        return len(self._store)
+
     def add(self, key: str, value: dict, ttl: int=None):
+        now = time.time()
         if ttl and ttl > 0:
-            expire = time.time() + ttl
+            expire = now + ttl
         else:
-            expire = time.time() + self._ttl
+            expire = now + self._ttl
+        data = self._codec.encode(value)
 
         with self._lock:
+            self._remove(key)
+            self._store[key] = data
+            self._bytes += len(data)
             self._expires[key] = expire
-            self._store[key] = json.dumps(value, cls=CustomJSONEncoder)
+            heapq.heappush(self._deadlines, (expire, key))
+            self.expire(now, _expire_batch_size)
+            self._evict()
+
+    def add_many(self, items: dict, ttl: int=None):
+        now = time.time()
+        if ttl and ttl > 0:
+            expire = now + ttl
+        else:
+            expire = now + self._ttl
+        encoded = [(key, self._codec.encode(value))
+                   for key, value in items.items()]
+
+        with self._lock:
+            for key, data in encoded:
+                self._remove(key)
+                self._store[key] = data
+                self._bytes += len(data)
+                self._expires[key] = expire
+                heapq.heappush(self._deadlines, (expire, key))
+            self.expire(now, _expire_batch_size)
+            self._evict()
 
     def clear(self):
         with self._lock:
-            self._store = dict()
+            self._store = OrderedDict()
             self._expires = dict()
+            self._deadlines = []
+            self._bytes = 0
 
     def delete(self, key: str):
         with self._lock:
-            if key in self._store:
-                del self._store[key]
-            if key in self._expires:
-                del self._expires[key]
+            self._remove(key)
+
+    def delete_many(self, keys: list):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def expire(self, now: float=None, limit: int=None) -> int:
+        """Remove up to limit (all if None) entries expired at now, return
+        the number removed."""
+        if now is None:
+            now = time.time()
+        removed = 0
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] < now:
+                if limit is not None and removed >= limit:
+                    break
+                expire, key = heapq.heappop(deadlines)
+                # skip the deadlines outdated by a later add or delete
+                if self._expires.get(key) == expire:
+                    self._remove(key)
+                    self._expirations += 1
+                    removed += 1
+            if len(deadlines) > 2 * len(self._expires) + 64:
+                self._deadlines = [(expire, key)
+                                   for key, expire in self._expires.items()]
+                heapq.heapify(self._deadlines)
+        return removed
 
     def expired(self, key: str) -> bool:
         try:
@@ -84,55 +282,1172 @@ class InMemoryStorage(Storage):
 
     def get(self, key: str) -> dict:
         if time.time() > self._expires[key]:
+            with self._lock:
+                self._remove(key)
+                self._expirations += 1
+            raise KeyExpiredError(key)
+        with self._lock:
+            data = self._store[key]
+            self._store.move_to_end(key)
+        return self._codec.decode(data)
+
+    def get_many(self, keys: list) -> dict:
+        now = time.time()
+        found = []
+        with self._lock:
+            for key in keys:
+                expire = self._expires.get(key)
+                if expire is None:
+                    continue
+                if now > expire:
+                    self._remove(key)
+                    self._expirations += 1
+                    continue
+                found.append((key, self._store[key]))
+                self._store.move_to_end(key)
+        return {key: self._codec.decode(data) for key, data in found}
+
+    def start_reaper(self, interval: float):
+        """Start a daemon thread removing the expired entries every interval
+        seconds."""
+        def reap():
+            while True:
+                time.sleep(interval)
+                self.expire()
+
+        Thread(target=reap, name="InMemoryStorageReaper", daemon=True).start()
+
+    def stats(self) -> dict:
+        """Entry count, approximate bytes, evictions and expirations."""
+        with self._lock:
+            return {"entries": len(self._store),
+                    "bytes": self._bytes,
+                    "evictions": self._evictions,
+                    "expirations": self._expirations,
+                    "max_entries": self._max_entries,
+                    "max_bytes": self._max_bytes}
+
+    def _evict(self):
+        store = self._store
+        while store and (
+                0 < self._max_entries < len(store) or
+                0 < self._max_bytes < self._bytes):
+            key, data = store.popitem(last=False)
+            self._bytes -= len(data)
+            del self._expires[key]
+            self._evictions += 1
+
+    def _remove(self, key: str):
+        data = self._store.pop(key, None)
+        if data is not None:
+            self._bytes -= len(data)
+        self._expires.pop(key, None)
+
+    # no I/O involved, so the awaitable operations just run inline
+
+    async def aadd(self, key: str, value: dict, ttl: int=None):
+        self.add(key, value, ttl)
+
+    async def adelete(self, key: str):
+        self.delete(key)
+
+    async def aget(self, key: str) -> dict:
+        return self.get(key)
+
+    async def aget_many(self, keys: list) -> dict:
+        return self.get_many(keys)
+
+
+class _MemoryShard:
+    """Entries of a ShardedMemoryStorage shard, guarded by its own lock."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.store = dict()         # key -> (snapshot, expire)
+        self.deadlines = []         # heap of (expire, key)
+
+    @staticmethod
+    def snapshot(value) -> bytes:
+        try:
+            # plain values, e.g. passed through from storage, go straight
+            return marshal.dumps(value)
+        except ValueError:
+            return marshal.dumps(to_plain(value))
+
+    def put(self, key: str, snapshot: bytes, expire: float, now: float):
+        self.store[key] = (snapshot, expire)
+        heapq.heappush(self.deadlines, (expire, key))
+        self.expire(now, _expire_batch_size)
+
+    def expire(self, now: float, limit: int=None) -> int:
+        removed = 0
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] < now:
+            if limit is not None and removed >= limit:
+                break
+            expire, key = heapq.heappop(deadlines)
+            item = self.store.get(key)
+            if item is not None and item[1] == expire:
+                del self.store[key]
+                removed += 1
+        if len(deadlines) > 2 * len(self.store) + 64:
+            self.deadlines = [(expire, key)
+                              for key, (_, expire) in self.store.items()]
+            heapq.heapify(self.deadlines)
+        return removed
+
+
+class ShardedMemoryStorage(Storage):
+    """In-process implementation with lock-striped shards.
+
+    Values never leave the process, so instead of going through the codec
+    they are kept as marshal snapshots of their plain data, which are
+    cheaper to read back than JSON, and to make when the data is plain
+    already. Every get returns a fresh copy, so callers mutating it never
+    corrupt the stored state. Unlike JSON, tuples and non-str keys of plain
+    data are kept as they are.
+
+    Each instance holds its own entries; Base shares the one set by [Base]
+    storage.
+    """
+
+    def __init__(self, shards: int=None, ttl: int=None):
+        """
+
+        Parameters
+        ----------
+        shards: number of shards, [ShardedMemoryStorage] shards if None.
+        ttl: default seconds to keep the values, [ShardedMemoryStorage] ttl
+            if None.
+        """
+        super().__init__(ttl or _config_value("ShardedMemoryStorage", "ttl",
+                                              _default_ttl))
+        shards = shards or _config_value("ShardedMemoryStorage", "shards",
+                                         _default_memory_shards)
+        self._shards = [_MemoryShard() for _ in range(max(shards, 1))]
+
+    def __contains__(self, key: str) -> bool:
+        item = self._shard(key).store.get(key)
+        return item is not None and time.time() <= item[1]
+
+    def __len__(self) -> int:
+        return sum(len(shard.store) for shard in self._shards)
+
+    def add(self, key: str, value: dict, ttl: int=None):
+        now = time.time()
+        shard = self._shard(key)
+        snapshot = shard.snapshot(value)
+        with shard.lock:
+            shard.put(key, snapshot, self._expire_at(now, ttl), now)
+
+    def add_many(self, items: dict, ttl: int=None):
+        now = time.time()
+        expire = self._expire_at(now, ttl)
+        for shard, keys in self._group(items).items():
+            snapshots = [(key, shard.snapshot(items[key])) for key in keys]
+            with shard.lock:
+                for key, snapshot in snapshots:
+                    shard.put(key, snapshot, expire, now)
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.store = dict()
+                shard.deadlines = []
+
+    def delete(self, key: str):
+        shard = self._shard(key)
+        with shard.lock:
+            shard.store.pop(key, None)
+
+    def delete_many(self, keys: list):
+        for shard, shard_keys in self._group(keys).items():
+            with shard.lock:
+                for key in shard_keys:
+                    shard.store.pop(key, None)
+
+    def expire(self, now: float=None) -> int:
+        """Remove all the expired entries, return the number removed."""
+        if now is None:
+            now = time.time()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += shard.expire(now)
+        return removed
+
+    def expired(self, key: str) -> bool:
+        return not self.__contains__(key)
+
+    def get(self, key: str) -> dict:
+        item = self._shard(key).store[key]
+        if time.time() > item[1]:
+            self.delete(key)
+            raise KeyExpiredError(key)
+        return marshal.loads(item[0])
+
+    def get_many(self, keys: list) -> dict:
+        now = time.time()
+        values = dict()
+        for shard, shard_keys in self._group(keys).items():
+            store = shard.store
+            for key in shard_keys:
+                item = store.get(key)
+                if item is not None and now <= item[1]:
+                    values[key] = marshal.loads(item[0])
+        return values
+
+    # no I/O involved, so the awaitable operations just run inline
+
+    async def aadd(self, key: str, value: dict, ttl: int=None):
+        self.add(key, value, ttl)
+
+    async def adelete(self, key: str):
+        self.delete(key)
+
+    async def aget(self, key: str) -> dict:
+        return self.get(key)
+
+    async def aget_many(self, keys: list) -> dict:
+        return self.get_many(keys)
+
+    def _expire_at(self, now: float, ttl: int=None) -> float:
+        return now + (ttl if ttl and ttl > 0 else self._ttl)
+
+    def _group(self, keys) -> dict:
+        groups = dict()
+        for key in keys:
+            groups.setdefault(self._shard(key), []).append(key)
+        return groups
+
+    def _shard(self, key: str) -> _MemoryShard:
+        return self._shards[hash(key) % len(self._shards)]
+
+
+class SQLiteStorage(Storage):
+    """Durable storage on local disk, an SQLite database in WAL mode.
+
+    Values are kept in a table indexed by key, so opening the database does
+    not load any value. Every write is a transaction, and the WAL keeps the
+    database consistent over crashes. Expired rows are purged every
+    purge_interval seconds, and compact() checkpoints the WAL and vacuums
+    the database file.
+    """
+
+    def __init__(self, path: str=None, ttl: int=None, codec: Codec=None,
+                 synchronous: str=None, purge_interval: float=None):
+        """
+
+        Parameters
+        ----------
+        path: database file, [SQLite] path if None.
+        ttl: default seconds to keep the values, [SQLite] ttl if None.
+        codec: codec to serialize the values, [Base] codec if None.
+        synchronous: SQLite synchronous pragma, [SQLite] synchronous if None.
+            NORMAL survives process crashes, FULL also power losses.
+        purge_interval: seconds between purges of the expired rows,
+            [SQLite] purge_interval if None.
+        """
+        super().__init__(ttl or _config_value("SQLite", "ttl", _default_ttl),
+                         codec)
+        self._path = path or _config_value("SQLite", "path",
+                                           _default_sqlite_path, str)
+        self._purge_interval = purge_interval if purge_interval is not None \
+            else _config_value("SQLite", "purge_interval",
+                               _default_purge_interval, float)
+        self._last_purge = time.time()
+        synchronous = synchronous or _config_value(
+            "SQLite", "synchronous", "NORMAL", str)
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError("Invalid synchronous %s" % synchronous)
+
+        self._store = sqlite3.connect(self._path, isolation_level=None,
+                                      check_same_thread=False)
+        with self._lock:
+            self._store.execute("PRAGMA journal_mode=WAL")
+            self._store.execute("PRAGMA synchronous=%s" % synchronous.upper())
+            self._store.execute(
+                "CREATE TABLE IF NOT EXISTS storage ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expire REAL NOT NULL) WITHOUT ROWID")
+            self._store.execute("CREATE INDEX IF NOT EXISTS storage_expire "
+                                "ON storage (expire)")
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._store.execute(
+                "SELECT 1 FROM storage WHERE key = ? AND expire >= ?",
+                (key, time.time())).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._store.execute(
+                "SELECT COUNT(*) FROM storage").fetchone()[0]
+
+    def add(self, key: str, value: dict, ttl: int=None):
+        self.add_many({key: value}, ttl)
+
+    def add_many(self, items: dict, ttl: int=None):
+        now = time.time()
+        expire = now + (ttl if ttl and ttl > 0 else self._ttl)
+        rows = [(key, self._codec.encode(value), expire)
+                for key, value in items.items()]
+        with self._lock:
+            with self._transaction():
+                self._store.executemany(
+                    "INSERT OR REPLACE INTO storage VALUES (?, ?, ?)", rows)
+            if self._purge_interval > 0 and \
+                    now - self._last_purge > self._purge_interval:
+                self.purge(now)
+
+    def clear(self):
+        with self._lock:
+            self._store.execute("DELETE FROM storage")
+
+    def close(self):
+        with self._lock:
+            self._store.close()
+
+    def compact(self):
+        """Purge expired rows, rebuild the database and checkpoint the WAL
+        into the database file."""
+        with self._lock:
+            self.purge()
+            # in WAL mode the rebuilt pages go to the WAL first
+            self._store.execute("VACUUM")
+            self._store.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def delete(self, key: str):
+        self.delete_many([key])
+
+    def delete_many(self, keys: list):
+        with self._lock:
+            with self._transaction():
+                self._store.executemany("DELETE FROM storage WHERE key = ?",
+                                        [(key,) for key in keys])
+
+    def expired(self, key: str) -> bool:
+        return not self.__contains__(key)
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            row = self._store.execute(
+                "SELECT value, expire FROM storage WHERE key = ?",
+                (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        if time.time() > row[1]:
             self.delete(key)
-            raise KeyError
-        return json.loads(self._store[key])
+            raise KeyExpiredError(key)
+        return self._codec.decode(row[0])
+
+    def get_many(self, keys: list) -> dict:
+        now = time.time()
+        rows = []
+        with self._lock:
+            for i in range(0, len(keys), _sqlite_batch_size):
+                batch = keys[i:i + _sqlite_batch_size]
+                rows += self._store.execute(
+                    "SELECT key, value FROM storage WHERE expire >= ? AND "
+                    "key IN (%s)" % ", ".join("?" * len(batch)),
+                    [now] + list(batch)).fetchall()
+        return {key: self._codec.decode(value) for key, value in rows}
+
+    def purge(self, now: float=None) -> int:
+        """Delete the expired rows, return the number deleted."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._last_purge = now
+            return self._store.execute(
+                "DELETE FROM storage WHERE expire < ?", (now,)).rowcount
+
+    @contextmanager
+    def _transaction(self):
+        self._store.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._store.execute("ROLLBACK")
+            raise
+        self._store.execute("COMMIT")
 
 
 class RedisStorage(Storage):
-    """Redis-based implementation"""
+    """Redis-based implementation.
 
-    def __init__(self, redis_client: redis.Redis, redis_name: str="TopicChat#"):
-        super().__init__()
+    Every key is stored as its own Redis key, prefixed by redis_name, with
+    a native TTL, so expiry is shared by all processes. Bulk operations use
+    MGET and pipelines, and clients created from a URL share one
+    connection pool per URL in the process.
+
+    The awaitable operations use a redis.asyncio client of their own,
+    created from the URL on first use. Its connections belong to the event
+    loop they were opened in, so it is meant to be used from one loop.
+    """
+
+    def __init__(self, redis_client: redis.Redis=None, redis_name: str=None,
+                 ttl: int=None, codec: Codec=None, url: str=None,
+                 async_client: redis.asyncio.Redis=None):
+        """
+
+        Parameters
+        ----------
+        redis_client: client to use, a client of the shared pool of url if
+            None.
+        redis_name: prefix of the keys, [Redis] prefix if None.
+        ttl: default seconds to keep the values, [Redis] ttl if None.
+        codec: codec to serialize the values, [Base] codec if None.
+        url: Redis URL, [Redis] url if None.
+        async_client: client of the awaitable operations, a client of url
+            created on first use if None.
+        """
+        super().__init__(ttl or _config_value("Redis", "ttl", _default_ttl),
+                         codec)
+        self._url = url or _config_value("Redis", "url", _default_redis_url,
+                                         str)
+        if redis_client is None:
+            redis_client = redis.Redis(connection_pool=_redis_pool(self._url))
         self._store = redis_client
-        self._expires = dict()
-        self._redis_name = redis_name
+        self._async_store = async_client
+        self._redis_name = redis_name or _config_value(
+            "Redis", "prefix", _default_redis_prefix, str)
 
     def __contains__(self, key: str) -> bool:
-        return key in self._expires
+        return self._store.exists(self._redis_name + key) > 0
 
     def add(self, key: str, value: dict, ttl: int=None):
-        if ttl and ttl > 0:
-            expire = time.time() + ttl
-        else:
-            expire = time.time() + self._ttl
+        self._store.set(self._redis_name + key, self._codec.encode(value),
+                        **self._expiry(ttl))
 
+    def add_many(self, items: dict, ttl: int=None):
+        """Add all key-values of items in one round trip."""
+        if not items:
+            return
+        expiry = self._expiry(ttl)
+        with self._store.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self._redis_name + key, self._codec.encode(value),
+                         **expiry)
+            pipe.execute()
+
+    def clear(self):
+        """Delete all keys with the prefix of this storage."""
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self._redis_name) + "*"
+        keys = []
+        for key in self._store.scan_iter(match=pattern,
+                                         count=_redis_batch_size):
+            keys.append(key)
+            if len(keys) >= _redis_batch_size:
+                self._store.delete(*keys)
+                keys = []
+        if keys:
+            self._store.delete(*keys)
+
+    def delete(self, key: str):
+        self._store.delete(self._redis_name + key)
+
+    def delete_many(self, keys: list):
+        """Delete keys in one round trip."""
+        if keys:
+            self._store.delete(*[self._redis_name + key for key in keys])
+
+    def expired(self, key: str) -> bool:
+        return not self.__contains__(key)
+
+    def get(self, key: str) -> dict:
+        data = self._store.get(self._redis_name + key)
+        if data is None:
+            raise KeyError(key)
+        return self._codec.decode(data)
+
+    def get_many(self, keys: list) -> dict:
+        """Get the values of keys in one round trip. Keys not found are
+        left out of the returned dict."""
+        if not keys:
+            return {}
+        data = self._store.mget([self._redis_name + key for key in keys])
+        return {key: self._codec.decode(value)
+                for key, value in zip(keys, data) if value is not None}
+
+    def _expiry(self, ttl: int=None) -> dict:
+        ttl = ttl if ttl and ttl > 0 else self._ttl
+        if isinstance(ttl, float) and not ttl.is_integer():
+            return {"px": int(ttl * 1000)}
+        return {"ex": int(ttl)}
+
+    def _async_client(self) -> redis.asyncio.Redis:
+        if self._async_store is None:
+            self._async_store = redis.asyncio.Redis.from_url(self._url)
+        return self._async_store
+
+    async def aadd(self, key: str, value: dict, ttl: int=None):
+        await self._async_client().set(self._redis_name + key,
+                                       self._codec.encode(value),
+                                       **self._expiry(ttl))
+
+    async def aadd_many(self, items: dict, ttl: int=None):
+        if not items:
+            return
+        expiry = self._expiry(ttl)
+        async with self._async_client().pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self._redis_name + key, self._codec.encode(value),
+                         **expiry)
+            await pipe.execute()
+
+    async def adelete(self, key: str):
+        await self._async_client().delete(self._redis_name + key)
+
+    async def adelete_many(self, keys: list):
+        if keys:
+            await self._async_client().delete(
+                *[self._redis_name + key for key in keys])
+
+    async def aget(self, key: str) -> dict:
+        data = await self._async_client().get(self._redis_name + key)
+        if data is None:
+            raise KeyError(key)
+        return self._codec.decode(data)
+
+    async def aget_many(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        data = await self._async_client().mget(
+            [self._redis_name + key for key in keys])
+        return {key: self._codec.decode(value)
+                for key, value in zip(keys, data) if value is not None}
+
+    async def aclose(self):
+        """Close the connections of the awaitable operations."""
+        if self._async_store is not None:
+            await self._async_store.aclose()
+            self._async_store = None
+
+
+class WriteBehindStorage(Storage):
+    """Write-behind layer in front of another storage.
+
+    add() only records a snapshot of the value in a dirty set, where repeated
+    adds of the same key are coalesced, and a background thread flushes the
+    dirty keys to the backend in batches. Reads check the dirty and the
+    in-flight snapshots first, so the next turn of a user always reads its
+    own writes. When more than max_pending keys are dirty, add() flushes a
+    batch itself, which slows writers down to the backend's pace.
+
+    Each instance has its own dirty set and flusher thread; Base shares the
+    one set by [Base] storage.
+    """
+
+    _deleted = None     # snapshot of a pending delete
+
+    def __init__(self, backend: Storage=None, flush_interval: float=None,
+                 batch_size: int=None, max_pending: int=None):
+        """
+
+        Parameters
+        ----------
+        backend: storage to write behind, [WriteBehind] backend if None.
+        flush_interval: seconds between flushes, [WriteBehind] flush_interval
+            if None.
+        batch_size: keys written per batch, [WriteBehind] batch_size if None.
+        max_pending: dirty keys before add() applies backpressure,
+            [WriteBehind] max_pending if None.
+        """
+        super().__init__()
+        if backend is None:
+            backend = import_module(
+                module_path=configs.get("WriteBehind", "backend"),
+                root_path=configs.get("Root", "root_path"))()
+        self._backend = backend
+        self._flush_interval = flush_interval or _config_value(
+            "WriteBehind", "flush_interval", _default_flush_interval, float)
+        self._batch_size = batch_size or _config_value(
+            "WriteBehind", "batch_size", _default_flush_batch_size)
+        self._max_pending = max_pending or _config_value(
+            "WriteBehind", "max_pending", _default_max_pending)
+
+        self._dirty = OrderedDict()     # key -> (snapshot, ttl)
+        self._inflight = dict()         # key -> (snapshot, ttl) being written
+        self._cond = Condition(self._lock)
+        self._flush_lock = RLock()      # keeps the writes of a key in order
+        self._running = True
+        self._flusher = Thread(target=self._run, name="WriteBehindFlusher",
+                               daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def __contains__(self, key: str) -> bool:
+        item = self._pending(key)
+        if item is not None:
+            return item[0] is not self._deleted
+        return key in self._backend
+
+    def __len__(self) -> int:
+        """Number of keys waiting to be flushed"""
+        return len(self._dirty) + len(self._inflight)
+
+    def add(self, key: str, value: dict, ttl: int=None):
+        snapshot = self._codec.encode(value)
+        self._mark(key, snapshot, ttl)
+
+    def add_many(self, items: dict, ttl: int=None):
+        for key, value in items.items():
+            self._mark(key, self._codec.encode(value), ttl)
+
+    def clear(self):
+        with self._flush_lock:
+            with self._lock:
+                self._dirty.clear()
+            self._backend.clear()
+
+    def delete(self, key: str):
+        self._mark(key, self._deleted, None)
+
+    def delete_many(self, keys: list):
+        for key in keys:
+            self._mark(key, self._deleted, None)
+
+    def expired(self, key: str) -> bool:
+        item = self._pending(key)
+        if item is not None:
+            return item[0] is self._deleted
+        return self._backend.expired(key)
+
+    def get(self, key: str) -> dict:
+        item = self._pending(key)
+        if item is not None:
+            if item[0] is self._deleted:
+                raise KeyError(key)
+            return self._codec.decode(item[0])
+        return self._backend.get(key)
+
+    def get_many(self, keys: list) -> dict:
+        values = dict()
+        missing = []
+        for key in keys:
+            item = self._pending(key)
+            if item is None:
+                missing.append(key)
+            elif item[0] is not self._deleted:
+                values[key] = self._codec.decode(item[0])
+        if missing:
+            values.update(self._backend.get_many(missing))
+        return values
+
+    def flush(self):
+        """Write all the dirty keys to the backend."""
+        while self._dirty:
+            if not self._flush_batch():
+                break
+
+    def close(self):
+        """Stop the flusher thread and flush what is left."""
         with self._lock:
-            self._expires[key] = expire
-        self._store.hset(self._redis_name,
-                         self._redis_name + key,
-                         json.dumps(value, cls=CustomJSONEncoder))
+            self._running = False
+            self._cond.notify_all()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        self.flush()
+
+    def install_signal_handlers(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """Flush on signals before running the previous handlers. Has to be
+        called from the main thread."""
+        for signum in signals:
+            previous = signal.getsignal(signum)
+
+            def handler(signum, frame, previous=previous):
+                self.flush()
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous == signal.SIG_DFL:
+                    signal.signal(signum, signal.SIG_DFL)
+                    signal.raise_signal(signum)
+
+            signal.signal(signum, handler)
+
+    def _mark(self, key: str, snapshot, ttl: int=None):
+        with self._lock:
+            self._dirty[key] = (snapshot, ttl)
+            pending = len(self._dirty)
+            if pending >= self._batch_size:
+                self._cond.notify_all()
+        if pending >= self._max_pending:
+            self._flush_batch()
+
+    def _pending(self, key: str):
+        with self._lock:
+            item = self._dirty.get(key)
+            if item is None:
+                item = self._inflight.get(key)
+            return item
+
+    def _flush_batch(self) -> bool:
+        """Write one batch of dirty keys, return False if it failed."""
+        with self._flush_lock:
+            with self._lock:
+                batch = []
+                while self._dirty and len(batch) < self._batch_size:
+                    key, item = self._dirty.popitem(last=False)
+                    self._inflight[key] = item
+                    batch.append((key, item))
+
+            # one bulk operation for the deletes and per ttl for the adds
+            groups = OrderedDict()
+            for key, (snapshot, ttl) in batch:
+                group = "delete" if snapshot is self._deleted else ttl
+                groups.setdefault(group, []).append((key, (snapshot, ttl)))
+
+            failed = []
+            for group, items in groups.items():
+                try:
+                    if group == "delete":
+                        self._backend.delete_many([key for key, _ in items])
+                    else:
+                        self._backend.add_many(
+                            {key: self._codec.decode(snapshot)
+                             for key, (snapshot, _) in items}, group)
+                except Exception:
+                    logging.exception("Failed to write %d keys behind" %
+                                      len(items))
+                    failed += items
+
+            with self._lock:
+                for key, _ in batch:
+                    del self._inflight[key]
+                for key, item in failed:
+                    # retry later unless written again in the meantime
+                    if key not in self._dirty:
+                        self._dirty[key] = item
+        return not failed
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._running:
+                    self._cond.wait(self._flush_interval)
+                if not self._running:
+                    return
+            self.flush()
+
+
+class TieredStorage(Storage):
+    """Bounded in-process L1 cache in front of another storage.
+
+    Every write stamps the key with a new version, kept in the backend
+    under key + version_suffix next to the value. An L1 entry is served
+    once the backend still holds its version, which only reads the tiny
+    version value instead of the whole session; an outdated entry, written
+    meanwhile by another process, is fetched again. Entries validated
+    within validate_interval seconds are served without asking the backend
+    at all, which is safe as long as the turns of a user are routed to the
+    same process.
+
+    With the default validate_interval of 0, every L1 hit still costs one
+    backend round trip for the version: the cache saves transferring and
+    decoding the payload, not the round trip. Set validate_interval when
+    users are routed to the same process to save the round trips too.
+
+    Each instance has its own L1 cache; Base shares the one set by [Base]
+    storage.
+    """
+
+    version_suffix = "#version"
+
+    def __init__(self, backend: Storage=None, max_entries: int=None,
+                 validate_interval: float=None):
+        """
+
+        Parameters
+        ----------
+        backend: storage behind the L1 cache, [Tiered] backend if None.
+        max_entries: maximum number of L1 entries, [Tiered] max_entries if
+            None, the least recently used are evicted.
+        validate_interval: seconds an L1 entry is trusted after it was
+            validated, [Tiered] validate_interval if None, 0 to always
+            validate.
+        """
+        super().__init__()
+        if backend is None:
+            backend = import_module(
+                module_path=configs.get("Tiered", "backend"),
+                root_path=configs.get("Root", "root_path"))()
+        self._backend = backend
+        self._ttl = backend._ttl
+        self._max_entries = max_entries or _config_value(
+            "Tiered", "max_entries", _default_l1_entries)
+        self._validate_interval = validate_interval \
+            if validate_interval is not None else _config_value(
+                "Tiered", "validate_interval", 0, float)
+        # key -> [snapshot, version, expire, validated], least recent first
+        self._store = OrderedDict()
+        self._counters = dict.fromkeys(
+            ("l1_hits", "l1_misses", "l1_stale", "l2_hits", "l2_misses",
+             "evictions"), 0)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is not None and time.time() <= entry[2]:
+                return True
+        return key in self._backend
+
+    def __len__(self) -> int:
+        """Number of L1 entries"""
+        return len(self._store)
+
+    def add(self, key: str, value: dict, ttl: int=None):
+        self.add_many({key: value}, ttl)
+
+    def add_many(self, items: dict, ttl: int=None):
+        """Write items and their new versions to the backend in one
+        operation, then to L1."""
+        if not items:
+            return
+        expire = time.time() + (ttl if ttl and ttl > 0 else self._ttl)
+        entries = dict()
+        writes = dict()
+        for key, value in items.items():
+            version = uuid.uuid4().hex
+            entries[key] = (_MemoryShard.snapshot(value), version)
+            writes[key] = value
+            writes[key + self.version_suffix] = {"version": version}
+        self._backend.add_many(writes, ttl)
+
+        now = time.time()
+        with self._lock:
+            for key, (snapshot, version) in entries.items():
+                self._store[key] = [snapshot, version, expire, now]
+                self._store.move_to_end(key)
+            self._evict()
 
     def clear(self):
         with self._lock:
-            self._expires = dict()
-        self._store.delete(self._redis_name)
+            self._store = OrderedDict()
+        self._backend.clear()
 
     def delete(self, key: str):
+        self.delete_many([key])
+
+    def delete_many(self, keys: list):
+        with self._lock:
+            for key in keys:
+                self._store.pop(key, None)
+        self._backend.delete_many(
+            [k for key in keys for k in (key, key + self.version_suffix)])
+
+    def discard(self, key: str):
+        """Drop key from L1 only, e.g. when another process took its user
+        over."""
         with self._lock:
-            if key in self._expires:
-                del self._expires[key]
-        self._store.hdel(self._redis_name, key)
+            self._store.pop(key, None)
 
     def expired(self, key: str) -> bool:
+        return not self.__contains__(key)
+
+    def get(self, key: str) -> dict:
+        values = self.get_many([key])
+        if key not in values:
+            raise KeyError(key)
+        return values[key]
+
+    def get_many(self, keys: list) -> dict:
+        """Serve keys from L1, validating their versions in one backend
+        operation, and fetch the rest, with their versions, in another."""
+        now = time.time()
+        values = dict()
+        cached = dict()     # key -> version to validate
+        with self._lock:
+            for key in keys:
+                entry = self._store.get(key)
+                if entry is None:
+                    continue
+                if now > entry[2]:
+                    del self._store[key]
+                    continue
+                self._store.move_to_end(key)
+                if now - entry[3] < self._validate_interval:
+                    values[key] = marshal.loads(entry[0])
+                else:
+                    cached[key] = entry[1]
+
+        suffix = self.version_suffix
+        if cached:
+            versions = self._backend.get_many([key + suffix for key in cached])
+            with self._lock:
+                for key, version in cached.items():
+                    entry = self._store.get(key)
+                    current = versions.get(key + suffix, {}).get("version")
+                    if entry is not None and current == version == entry[1]:
+                        entry[3] = now
+                        values[key] = marshal.loads(entry[0])
+                    else:
+                        self._store.pop(key, None)
+                        self._counters["l1_stale"] += 1
+
+        missing = [key for key in keys if key not in values]
+        fetched = dict()
+        if missing:
+            fetched = self._backend.get_many(
+                [k for key in missing for k in (key, key + suffix)])
+
+        with self._lock:
+            counters = self._counters
+            counters["l1_hits"] += len(values)
+            counters["l1_misses"] += len(missing)
+            for key in missing:
+                value = fetched.get(key)
+                if value is None:
+                    counters["l2_misses"] += 1
+                    continue
+                counters["l2_hits"] += 1
+                values[key] = value
+                version = fetched.get(key + suffix, {}).get("version")
+                if version is not None:
+                    # the backend does not tell the remaining ttl, so L1
+                    # keeps it for the default one at most
+                    self._store[key] = [_MemoryShard.snapshot(value), version,
+                                        now + self._ttl, now]
+                    self._store.move_to_end(key)
+            self._evict()
+        return values
+
+    def stats(self) -> dict:
+        """Counters and hit rates of both tiers. L1 misses include the stale
+        entries, L2 is only asked for the L1 misses."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["l1_entries"] = len(self._store)
+            stats["max_entries"] = self._max_entries
+        l1 = stats["l1_hits"] + stats["l1_misses"]
+        l2 = stats["l2_hits"] + stats["l2_misses"]
+        stats["l1_hit_rate"] = stats["l1_hits"] / l1 if l1 else 0.0
+        stats["l2_hit_rate"] = stats["l2_hits"] / l2 if l2 else 0.0
+        return stats
+
+    def _evict(self):
+        store = self._store
+        while len(store) > self._max_entries:
+            store.popitem(last=False)
+            self._counters["evictions"] += 1
+
+
+class InstrumentedStorage(Storage):
+    """Storage recording metrics of the operations of another storage.
+
+    Every operation has a latency histogram and an error counter, lookups
+    are counted as hits, misses or expired, and the encoded sizes of one
+    in size_sample values read or written are kept in payload histograms.
+    snapshot() returns all of them, prometheus() renders them as text for
+    metrics.serve_prometheus or any HTTP handler.
+
+    Each instance instruments its own backend; Base shares the one set by
+    [Base] storage.
+    """
+
+    _operations = ("get", "get_many", "add", "add_many", "delete",
+                   "delete_many", "contains")
+
+    def __init__(self, backend: Storage=None, size_sample: int=None):
+        """
+
+        Parameters
+        ----------
+        backend: storage to instrument, [Instrumented] backend if None.
+        size_sample: measure the size of one in size_sample values,
+            [Instrumented] size_sample if None, 0 to never measure, as it
+            encodes the value again.
+        """
+        super().__init__()
+        if backend is None:
+            backend = import_module(
+                module_path=configs.get("Instrumented", "backend"),
+                root_path=configs.get("Root", "root_path"))()
+        self._backend = backend
+        self._ttl = backend._ttl
+        self._codec = backend.codec
+        self._size_sample = size_sample if size_sample is not None else \
+            _config_value("Instrumented", "size_sample",
+                          _default_size_sample)
+        self._sampled = 0
+        self._latency = {op: Histogram(default_latency_buckets)
+                         for op in self._operations}
+        self._sizes = {direction: Histogram(default_size_buckets)
+                       for direction in ("read", "write")}
+        self._errors = dict.fromkeys(self._operations, 0)
+        self._lookups = dict.fromkeys(("hit", "miss", "expired"), 0)
+
+    @property
+    def backend(self) -> Storage:
+        return self._backend
+
+    def __contains__(self, key: str) -> bool:
+        with self._timed("contains"):
+            return key in self._backend
+
+    def __len__(self) -> int:
+        return len(self._backend)
+
+    def add(self, key: str, value: dict, ttl: int=None):
+        self._measure("write", value)
+        with self._timed("add"):
+            self._backend.add(key, value, ttl)
+
+    def add_many(self, items: dict, ttl: int=None):
+        for value in items.values():
+            self._measure("write", value)
+        with self._timed("add_many"):
+            self._backend.add_many(items, ttl)
+
+    def clear(self):
+        self._backend.clear()
+
+    def delete(self, key: str):
+        with self._timed("delete"):
+            self._backend.delete(key)
+
+    def delete_many(self, keys: list):
+        with self._timed("delete_many"):
+            self._backend.delete_many(keys)
+
+    def expired(self, key: str) -> bool:
+        return self._backend.expired(key)
+
+    def get(self, key: str) -> dict:
         try:
-            return time.time() > self._expires[key]
+            with self._timed("get", KeyError):
+                value = self._backend.get(key)
+        except KeyExpiredError:
+            self._count("expired")
+            raise
         except KeyError:
-            return not self.__contains__(key)
+            self._count("miss")
+            raise
+        self._count("hit")
+        self._measure("read", value)
+        return value
 
-    def get(self, key: str) -> dict:
-        if time.time() > self._expires[key]:
-            self.delete(key)
-            raise KeyError
-        return json.loads(self._store.hget(self._redis_name, key))
+    def get_many(self, keys: list) -> dict:
+        with self._timed("get_many"):
+            values = self._backend.get_many(keys)
+        with self._lock:
+            self._lookups["hit"] += len(values)
+            self._lookups["miss"] += len(keys) - len(values)
+        for value in values.values():
+            self._measure("read", value)
+        return values
+
+    async def aadd(self, key: str, value: dict, ttl: int=None):
+        self._measure("write", value)
+        with self._timed("add"):
+            await self._backend.aadd(key, value, ttl)
 
+    async def adelete(self, key: str):
+        with self._timed("delete"):
+            await self._backend.adelete(key)
+
+    async def aget(self, key: str) -> dict:
+        try:
+            with self._timed("get", KeyError):
+                value = await self._backend.aget(key)
+        except KeyExpiredError:
+            self._count("expired")
+            raise
+        except KeyError:
+            self._count("miss")
+            raise
+        self._count("hit")
+        self._measure("read", value)
+        return value
+
+    async def aget_many(self, keys: list) -> dict:
+        with self._timed("get_many"):
+            values = await self._backend.aget_many(keys)
+        with self._lock:
+            self._lookups["hit"] += len(values)
+            self._lookups["miss"] += len(keys) - len(values)
+        for value in values.values():
+            self._measure("read", value)
+        return values
+
+    def reset(self):
+        """Start the metrics over."""
+        with self._lock:
+            self._latency = {op: Histogram(default_latency_buckets)
+                             for op in self._operations}
+            self._sizes = {direction: Histogram(default_size_buckets)
+                           for direction in ("read", "write")}
+            self._errors = dict.fromkeys(self._operations, 0)
+            self._lookups = dict.fromkeys(self._lookups, 0)
+
+    def snapshot(self) -> dict:
+        """Latency histograms and errors of each operation, lookup results
+        and payload size histograms."""
+        with self._lock:
+            latency, sizes = self._latency, self._sizes
+            errors, lookups = dict(self._errors), dict(self._lookups)
+        return {
+            "operations": {op: {"latency": latency[op].snapshot(),
+                                "errors": errors[op]}
+                           for op in self._operations},
+            "lookups": lookups,
+            "payload_bytes": {direction: histogram.snapshot()
+                              for direction, histogram in sizes.items()}
+        }
+
+    def prometheus(self, prefix: str="topicbot_storage") -> str:
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        operations = snapshot["operations"]
+        return prometheus_text([
+            (prefix + "_operation_seconds", "histogram",
+             "Latency of the storage operations.",
+             [({"operation": op}, item["latency"])
+              for op, item in operations.items()]),
+            (prefix + "_errors_total", "counter",
+             "Storage operations which raised an error.",
+             [({"operation": op}, item["errors"])
+              for op, item in operations.items()]),
+            (prefix + "_lookups_total", "counter",
+             "Keys looked up by result.",
+             [({"result": result}, count)
+              for result, count in snapshot["lookups"].items()]),
+            (prefix + "_payload_bytes", "histogram",
+             "Encoded size of the sampled values.",
+             [({"direction": direction}, histogram)
+              for direction, histogram in
+              snapshot["payload_bytes"].items()])
+        ])
+
+    def _count(self, result: str):
+        with self._lock:
+            self._lookups[result] += 1
+
+    def _measure(self, direction: str, value: dict):
+        if self._size_sample <= 0:
+            return
+        self._sampled += 1
+        if self._sampled % self._size_sample:
+            return
+        try:
+            size = len(self._codec.encode(value))
+        except Exception:
+            return
+        self._sizes[direction].observe(size)
+
+    @contextmanager
+    def _timed(self, op: str, expected=()):
+        """Time the block into the histogram of op, count its errors except
+        the expected ones."""
+        start = time.perf_counter()
+        try:
+            yield
+        except expected:
+            raise
+        except Exception:
+            with self._lock:
+                self._errors[op] += 1
+            raise
+        finally:
+            self._latency[op].observe(time.perf_counter() - start)
@@ -2,24 +2,53 @@
 
 import logging
 import os
-import uuid
+import json
+import time
+import hashlib
 import inspect
+import weakref
+import threading
 import importlib.util
 
 from abc import abstractclassmethod, abstractmethod
 from inspect import isclass
 from typing import Dict, Type, List, Tuple, Union
 from collections import OrderedDict
+from threading import Lock, RLock
 
-from topicbot.utils import singleton
+from topicbot.utils import singleton, new_id
 from .configs import configs
 from .dialog import Dialog
+from .exceptions import TopicDefinitionError
+from .reloader import Reloader, reload_files, scan_files
 
 
 class Topic:
+    """
+    Intents are dispatched through a table built once per subclass from
+    intent_maps(), when the topic is loaded: intent label -> (name of the
+    handler method, declared params). Topics not overriding
+    _respond_param_missing get the declared params of the label checked for
+    them, and are asked for a response by _respond_params_missing with the
+    missing ones.
+
+    Topics keeping no state of their own besides the dialog of the turn,
+    which respond() is given, can set stateless: TopicFactory then reuses
+    one instance per thread instead of creating one per turn. The id of a
+    reused instance is its own and stays the same across turns, and its
+    dialog is dropped when respond() returns.
+    """
+
+    stateless = False
+    _dispatch = None    # intent label -> (method name, params), per subclass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # not inherited, as the maps may be overridden
+        cls._dispatch = None
 
     def __init__(self, id: str=None):
-        self._id = id if id else str(uuid.uuid1())
+        self._id = id if id else new_id()
         self._dialog = None
 
     def __repr__(self):
@@ -36,7 +65,7 @@ class Topic:
     def get(self, key: str):
         """Get the most possible value from self._dialog.
         If no data found, None will be returned."""
-        return self._dialog[key]
+        return self._dialog.get(key)
 
     @abstractmethod
     def intent_maps(self) -> Dict[str, dict]:
@@ -72,30 +101,113 @@ class Topic:
     def name(self) -> str:
         return self._name()
 
+    @classmethod
+    def compile_dispatch(cls) -> Dict[str, tuple]:
+        """Build and keep the dispatch table of this topic from its
+        intent_maps(). Raise TopicDefinitionError if a label maps to no
+        method, or declares malformed params.
+
+        intent_maps() is called on an instance not initialized, topics
+        whose maps depend on instance state are dispatched per turn.
+        """
+        try:
+            maps = cls.intent_maps(cls.__new__(cls))
+        except Exception:
+            logging.debug("Dispatching %s per turn, its intent maps need an "
+                          "initialized instance", cls.__name__)
+            cls._dispatch = {}
+            return cls._dispatch
+
+        if maps is None:
+            # intent_maps() not implemented, e.g. by a base topic
+            cls._dispatch = {}
+            return cls._dispatch
+        if not isinstance(maps, dict):
+            raise TopicDefinitionError(
+                "%s.intent_maps() returned %s instead of a dict" %
+                (cls.__name__, type(maps).__name__))
+        dispatch = dict()
+        for label, intent in maps.items():
+            dispatch[label] = cls._compile_intent(label, intent)
+        cls._dispatch = dispatch
+        return dispatch
+
+    @classmethod
+    def _compile_intent(cls, label: str, intent: dict) -> tuple:
+        """(method name, params) of intent, validated. The method is looked
+        up on the instance when called, so staticmethods, classmethods and
+        per-instance overrides are bound as usual."""
+        where = "%s intent %s" % (cls.__name__, label)
+        if not isinstance(intent, dict) or "method" not in intent:
+            raise TopicDefinitionError("%s has no method" % where)
+        handler = getattr(cls, intent["method"], None)
+        if not callable(handler):
+            raise TopicDefinitionError("%s maps to %s, which is not a method" %
+                                       (where, intent["method"]))
+
+        params = intent.get("params") or ()
+        if not isinstance(params, (list, tuple)):
+            raise TopicDefinitionError("%s params is not a list" % where)
+        for param in params:
+            if not isinstance(param, dict) or \
+                    not isinstance(param.get("param"), str):
+                raise TopicDefinitionError(
+                    "%s declares param %r without a name" % (where, param))
+        return intent["method"], tuple(params)
+
     def _respond_param_missing(self) -> Union[dict, List[dict], Tuple[dict]]:
         """Return Response instance if some param miss, or None if no param missing."""
         raise NotImplementedError
 
+    def _respond_params_missing(self, label: str, params: List[dict]) -> \
+            Union[dict, List[dict], Tuple[dict]]:
+        """Responses asking for the declared params of label missing from
+        the dialog, e.g. from their "meaning"."""
+        raise NotImplementedError
+
     def respond(self, dialog: Dialog, label: str, **kwargs) -> \
             Union[dict, List[dict], Tuple[dict]]:
         """Respond to user input"""
         self._dialog = dialog
-        # check params
-        res_param_missing = self._respond_param_missing()
-        if res_param_missing:
-            responses = res_param_missing
-        else:
-            responses = []
-            method_name = self.intent_maps()[label]["method"]
-            res = getattr(self, method_name)()
-            if res:
-                if isinstance(res, dict):
-                    responses.append(res)
-                elif isinstance(res, (list, tuple)):
-                    for r in res:
-                        responses.append(r)
-
-        return responses
+        try:
+            dispatch = self._dispatch
+            if dispatch is None:
+                dispatch = self.compile_dispatch()
+            intent = dispatch.get(label)
+            if intent is None:
+                # maps needing an initialized instance, looked up each turn
+                # without being validated again
+                intent = self.intent_maps()[label]
+                intent = intent["method"], intent.get("params") or ()
+            method_name, params = intent
+
+            # check params
+            if type(self)._respond_param_missing is not \
+                    Topic._respond_param_missing:
+                res_param_missing = self._respond_param_missing()
+            else:
+                missing = [param for param in params
+                           if dialog.get(param["param"]) is None]
+                res_param_missing = self._respond_params_missing(
+                    label, missing) if missing else None
+
+            if res_param_missing:
+                responses = res_param_missing
+            else:
+                responses = []
+                res = getattr(self, method_name)()
+                if res:
+                    if isinstance(res, dict):
+                        responses.append(res)
+                    elif isinstance(res, (list, tuple)):
+                        for r in res:
+                            responses.append(r)
+
+            return responses
+        finally:
+            # a reused instance holds no dialog between its turns
+            if self.stateless:
+                self._dialog = None
 
     def status(self):
         # todo add other status
@@ -104,16 +216,195 @@ class Topic:
         }
 
 
-@singleton
-class TopicFactory:
+_memo_size = 4096     # resolved intent labels remembered per registry
+_manifest_name = "topics-%s.json"   # in the cache directory
+_manifest_version = 1
 
-    def __init__(self):
-        self._topics = self._load_topics()
-        self._default_topic = configs.get("Topics", "default_topic")
 
-    @property
-    def default_topic_name(self):
-        return self._default_topic
+def _import_topics(path: str) -> Dict[str, Type[Topic]]:
+    """Execute the module file at path and collect its named Topic
+    subclasses."""
+    topics = {}
+    f = os.path.basename(path)
+    module_spec = importlib.util.spec_from_file_location(f, path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+
+    for attr, _ in inspect.getmembers(module):
+        memb = getattr(module, attr)
+        if isclass(memb) and issubclass(memb, Topic):
+            try:
+                topic_name = memb._name()
+                if topic_name is not None:
+                    topics[topic_name] = memb
+            except NotImplementedError:
+                continue
+    for topic in topics.values():
+        topic.compile_dispatch()
+    return topics
+
+
+def _default_manifest_path(path: str) -> str:
+    """Manifest of the topics folder at path, in the user cache directory
+    rather than in the folder, which may be read-only."""
+    cache = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha1(
+        os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache, "topicbot", _manifest_name % digest)
+
+
+class _TopicManifest:
+    """Topic names defined by each topic file, keyed by the file path and
+    stamped with its mtime and size, saved as JSON between runs so that
+    unchanged files need not be imported to know their topics."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._files = dict()    # file path -> [mtime_ns, size, names]
+        self._dirty = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == _manifest_version:
+                self._files = data["files"]
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.warning("Ignoring unreadable topic manifest %s", path)
+
+    def names(self, path: str, stamp: list) -> Union[List[str], None]:
+        """Topic names of path, None if unknown or the file changed."""
+        item = self._files.get(path)
+        if item is None or item[:2] != stamp:
+            return None
+        return item[2]
+
+    def record(self, path: str, stamp: list, names: List[str]):
+        if self._files.get(path) != stamp + [names]:
+            self._files[path] = stamp + [names]
+            self._dirty = True
+
+    def prune(self, paths):
+        """Forget the files not in paths."""
+        for path in set(self._files) - set(paths):
+            del self._files[path]
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp = "%s.%d.tmp" % (self._path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": _manifest_version, "files": self._files},
+                          f)
+            os.replace(tmp, self._path)
+            self._dirty = False
+        except OSError:
+            logging.warning("Failed to save topic manifest %s", self._path)
+
+
+class _TopicRegistry:
+    """Snapshot of the topics with a prefix trie of their names.
+
+    Topics are either loaded classes or, for lazy loading, the source files
+    defining them, which are imported the first time one of their topics
+    is created. The longest topic name an intent label starts with is found
+    by walking the label down the trie once, in O(len(label)) whatever the
+    number of topics, and remembered per label. The set of topics of a
+    registry never changes: TopicFactory swaps in a new registry, so
+    concurrent turns see either the old or the new topics, never a mix.
+    """
+
+    _terminal = ""  # key of the topic name in the node it ends at
+
+    def __init__(self, topics: Dict[str, Type[Topic]],
+                 sources: Dict[str, str]=None):
+        """
+
+        Parameters
+        ----------
+        topics: loaded topic classes by name.
+        sources: files by name of the topics not imported yet.
+        """
+        self.topics = dict(topics)
+        self.sources = {name: path for name, path in (sources or {}).items()
+                        if name not in self.topics}
+        self._lock = Lock()
+        self._trie = dict()
+        self._memo = dict()
+        for name in list(self.topics) + list(self.sources):
+            if not name:
+                continue
+            node = self._trie
+            for char in name:
+                node = node.setdefault(char, {})
+            node[self._terminal] = name
+
+    def __contains__(self, topic_name: str) -> bool:
+        return topic_name in self.topics or topic_name in self.sources
+
+    def names(self) -> List[str]:
+        return list(self.topics) + list(self.sources)
+
+    def get(self, topic_name: str) -> Type[Topic]:
+        """Topic class of topic_name, importing its file on first use.
+        Raise KeyError if there is no such topic."""
+        topic = self.topics.get(topic_name)
+        if topic is not None:
+            return topic
+
+        path = self.sources[topic_name]
+        with self._lock:
+            if topic_name not in self.topics:
+                for name, topic in _import_topics(path).items():
+                    if self.sources.get(name) == path:
+                        self.topics[name] = topic
+            return self.topics[topic_name]
+
+    def match(self, intent_label: str) -> str:
+        """Longest topic name intent_label starts with, "" if none."""
+        topic_name = self._memo.get(intent_label)
+        if topic_name is not None:
+            return topic_name
+
+        topic_name = ""
+        node = self._trie
+        for char in intent_label:
+            node = node.get(char)
+            if node is None:
+                break
+            topic_name = node.get(self._terminal, topic_name)
+
+        if len(self._memo) >= _memo_size:
+            self._memo = dict()
+        self._memo[intent_label] = topic_name
+        return topic_name
+
+
+class _TopicFolder:
+    """Topics of the module files under a folder: their registry, and the
+    stamps of the files and the timings they were loaded with.
+
+    Which topics each file defines is cached in a manifest, so with
+    lazy_load the unchanged files are only imported the first time one of
+    their topics is created, and only new or modified files are imported
+    right away.
+    """
+
+    def __init__(self, path: str, lazy_load: bool=True, recursive: bool=True,
+                 manifest_path: str=None):
+        self.path = path
+        self.lazy_load = lazy_load
+        self.recursive = recursive
+        self.manifest_path = manifest_path or _default_manifest_path(path)
+        self.registry = _TopicRegistry({})
+        self.files = dict()     # file path -> ([mtime_ns, size], names)
+        self.timings = OrderedDict()
+        self.last_used = time.time()
+        self._lock = RLock()
 
     def _get_all_paths(self, path: str) -> List[str]:
         all_paths = [path]
@@ -123,89 +414,358 @@ class TopicFactory:
                 all_paths += self._get_all_paths(sub_path)
         return all_paths
 
-    def _load_topics_by_models_folder(self, models_folder: str) -> dict:
-        """
+    def _scan(self) -> Dict[str, list]:
+        """[mtime_ns, size] of each topic file of the folder."""
+        return scan_files(self._get_all_paths(self.path) if self.recursive
+                          else [self.path])
 
-        Parameters
-        ----------
-        models_folder: the folder contains topics of different customers.
-            The names of its sub-folder are customers' names.
+    def load(self):
+        """Load the topics of the folder. Raise FileNotFoundError if the
+        folder does not exist."""
+        timings = self.timings
+        timer = time.perf_counter()
+        files = self._scan()
+        timings["scan"] = time.perf_counter() - timer
 
-        Returns
-        -------
+        timer = time.perf_counter()
+        manifest = _TopicManifest(self.manifest_path)
+        timings["manifest"] = time.perf_counter() - timer
 
-        """
+        timer = time.perf_counter()
         topics = {}
+        sources = {}
+        known = dict()
+        imported = 0
+        for path, stamp in files.items():
+            names = manifest.names(path, stamp) if self.lazy_load else None
+            if names is None:
+                loaded = _import_topics(path)
+                imported += 1
+                names = list(loaded)
+                manifest.record(path, stamp, names)
+                for name in loaded:
+                    sources.pop(name, None)
+                topics.update(loaded)
+            else:
+                for name in names:
+                    topics.pop(name, None)
+                    sources[name] = path
+            known[path] = (stamp, names)
+        timings["import"] = time.perf_counter() - timer
+
+        timer = time.perf_counter()
+        manifest.prune(files)
+        manifest.save()
+        with self._lock:
+            self.registry = _TopicRegistry(topics, sources)
+            self.files = known
+        timings["index"] = time.perf_counter() - timer
+
+        logging.info("Loaded %d topics of %d files (%d imported) from %s in "
+                     "%.3fs: %s", len(topics) + len(sources), len(files),
+                     imported, self.path, sum(timings.values()),
+                     ", ".join("%s %.3fs" % item for item in timings.items()))
+
+    def reload(self) -> List[str]:
+        """Re-import the files added or modified since they were loaded,
+        drop the topics of the removed ones, and swap in the updated
+        registry at once. Return the paths of the changed files."""
+        with self._lock:
+            try:
+                files = self._scan()
+            except FileNotFoundError:
+                files = OrderedDict()
+            changes = reload_files(self.files, files, _import_topics)
+            if changes is None:
+                return []
+
+            registry = self.registry
+            topics = {name: topic for name, topic in registry.topics.items()
+                      if name not in changes.stale}
+            topics.update(changes.loaded)
+            sources = {name: path for name, path in registry.sources.items()
+                       if name not in changes.stale}
+            self.registry = _TopicRegistry(topics, sources)
+            self.files = changes.files
+
+            manifest = _TopicManifest(self.manifest_path)
+            for path, (stamp, names) in changes.files.items():
+                if path not in changes.failed:
+                    manifest.record(path, stamp, names)
+            manifest.prune(changes.files)
+            manifest.save()
+
+        logging.info("Reloaded topics of %d changed and %d removed files "
+                     "of %s", len(changes.changed), len(changes.removed),
+                     self.path)
+        return changes.changed + changes.removed
+
+    def update_topics(self, topics: Dict[str, Type[Topic]]):
+        for topic in topics.values():
+            topic.compile_dispatch()
+        with self._lock:
+            registry = self.registry
+            merged = dict(registry.topics)
+            merged.update(topics)
+            self.registry = _TopicRegistry(merged, registry.sources)
+
+    def remove_topics(self, topic_names: List[str]):
+        with self._lock:
+            registry = self.registry
+            self.registry = _TopicRegistry(
+                {name: topic for name, topic in registry.topics.items()
+                 if name not in topic_names},
+                {name: path for name, path in registry.sources.items()
+                 if name not in topic_names})
 
-        for path in self._get_all_paths(models_folder):
-
-            for f in os.listdir(path):
-
-                if not f.endswith(".py"):
-                    continue
 
-                sub_path = os.path.join(path, f)
+@singleton
+class TopicFactory:
+    """Load the topics of [Topics] topic_path and create their instances.
+
+    Which topics each file defines is cached in a manifest, [Topics]
+    manifest_path or by default a file named after the folder in
+    $XDG_CACHE_HOME/topicbot (~/.cache/topicbot), so that topic_path may be
+    read-only. If the manifest cannot be saved, a warning is logged and
+    every start imports all the files. With [Topics]
+    lazy_load on, the default, startup then only stats the files: the
+    unchanged ones are imported the first time one of their topics is
+    created, and only new or modified files are imported right away.
+
+    With [Topics] per_customer on, each sub-folder of topic_path is the
+    registry of the customer it is named after, loaded when the first
+    message of that customer arrives, and unloaded after [Topics]
+    customer_idle_ttl seconds without messages if set. Files right in
+    topic_path are then shared by all the customers, whose own topics
+    take precedence.
+
+    reload() re-imports the files changed since, polled every [Topics]
+    reload_interval seconds if set, and swaps in the updated registries.
+    """
 
-                module_spec = importlib.util.spec_from_file_location(f, sub_path)
-                module = importlib.util.module_from_spec(module_spec)
-                module_spec.loader.exec_module(module)
+    def __init__(self):
+        self._lazy_load = configs.get("Topics", "lazy_load").lower() not in \
+            ("0", "false", "no", "off")
+        self._per_customer = configs.get("Topics", "per_customer").lower() \
+            in ("1", "true", "yes", "on")
+        idle_ttl = configs.get("Topics", "customer_idle_ttl")
+        self._customer_idle_ttl = float(idle_ttl) if idle_ttl else 0
+        self._customers = dict()    # customer -> _TopicFolder
+        self._customers_lock = RLock()
+        self._next_eviction = 0
+        self._local = threading.local()     # reused stateless topics
+        # thread -> its reused stateless topics, dropped with the thread
+        self._pools = weakref.WeakKeyDictionary()
+        self._pools_lock = Lock()
+        self._generation = 0    # bumped when the loaded topics change
+        self._reloader = None
+        self._folder = self._load_topics()
+        self._default_topic = configs.get("Topics", "default_topic")
+        reload_interval = configs.get("Topics", "reload_interval")
+        if reload_interval and float(reload_interval) > 0:
+            self.start_reloader(float(reload_interval))
 
-                for attr, _ in inspect.getmembers(module):
-                    memb = getattr(module, attr)
-                    if isclass(memb) and issubclass(memb, Topic):
-                        try:
-                            topic_name = memb._name()
-                            if topic_name is not None:
-                                topics[topic_name] = memb
-                        except NotImplementedError:
-                            continue
+    @property
+    def default_topic_name(self):
+        return self._default_topic
 
-        return topics
+    @property
+    def startup_timings(self) -> dict:
+        """Seconds spent in each phase of loading the topics of topic_path,
+        the shared ones with per_customer on."""
+        return dict(self._folder.timings)
 
-    def _load_topics(self) -> Dict[str, Type[Topic]]:
+    def _load_topics(self) -> _TopicFolder:
         """Load all topics from topic path written in Configs instance"""
-        topics = {}
+        topic_path = configs.get("Topics", "topic_path")
+        manifest_path = configs.get("Topics", "manifest_path")
+        recursive = not self._per_customer
+        folder = _TopicFolder(topic_path, self._lazy_load, recursive,
+                              manifest_path)
+        loaded = True
         try:
-            topics = self._load_topics_by_models_folder(
-                configs.get("Topics", "topic_path"))
+            folder.load()
         except FileNotFoundError:
             # todo logging
-            pass
+            loaded = False
 
-        if not topics:
+        # customers' topics may all be in sub-folders
+        if not loaded or not (self._per_customer or folder.registry.names()):
+            root_folder = _TopicFolder(
+                os.path.join(configs.get("Root", "root_path"), topic_path),
+                self._lazy_load, recursive, manifest_path)
             try:
-                topics = self._load_topics_by_models_folder(
-                    os.path.join(configs.get("Root", "root_path"),
-                                 configs.get("Topics", "topic_path"))
-                )
+                root_folder.load()
+                folder = root_folder
             except FileNotFoundError:
                 # todo logging
                 pass
 
-        return topics
-
-    def has_topic(self, topic_name: str=""):
-        return topic_name in self._topics
-
-    def get_topic_name(self, intent_label: str) -> str:
-        """Get topic name through comparing intent_label and topic names."""
-        match = 0
-        topic_name = ""
-        for name in self._topics:
-            score = len(name)
-            if intent_label.startswith(name) and score > match:
+        return folder
+
+    def _customer_folder(self, customer: str=None) -> \
+            Union[_TopicFolder, None]:
+        """Topics of customer, loaded on first use, None without
+        per_customer."""
+        if not self._per_customer or not customer:
+            return None
+
+        now = time.time()
+        folder = self._customers.get(customer)
+        if folder is None:
+            if customer in (".", "..") or os.path.basename(customer) != \
+                    customer:
+                return None
+            with self._customers_lock:
+                folder = self._customers.get(customer)
+                if folder is None:
+                    folder = _TopicFolder(
+                        os.path.join(self._folder.path, customer),
+                        self._lazy_load)
+                    try:
+                        folder.load()
+                    except FileNotFoundError:
+                        logging.warning("No topics folder of customer %s",
+                                        customer)
+                    self._customers[customer] = folder
+        folder.last_used = now
+
+        if 0 < self._customer_idle_ttl and self._next_eviction <= now:
+            self.evict_idle(now)
+        return folder
+
+    def _folder_of(self, topic_name: str, customer: str=None) -> _TopicFolder:
+        folder = self._customer_folder(customer)
+        if folder is not None and topic_name in folder.registry:
+            return folder
+        return self._folder
+
+    def evict_idle(self, now: float=None) -> List[str]:
+        """Unload the customers without messages for customer_idle_ttl
+        seconds, return them."""
+        if now is None:
+            now = time.time()
+        evicted = []
+        with self._customers_lock:
+            self._next_eviction = now + self._customer_idle_ttl / 2
+            for customer, folder in list(self._customers.items()):
+                if now - folder.last_used > self._customer_idle_ttl:
+                    del self._customers[customer]
+                    evicted.append(customer)
+        if evicted:
+            self._clear_pools()
+            logging.info("Unloaded the topics of idle customers %s",
+                         ", ".join(evicted))
+        return evicted
+
+    def customers_stats(self) -> dict:
+        """Topics, idle seconds and load seconds of each loaded customer."""
+        now = time.time()
+        with self._customers_lock:
+            folders = list(self._customers.items())
+        return {customer: {"topics": len(folder.registry.names()),
+                           "idle": now - folder.last_used,
+                           "load_time": sum(folder.timings.values())}
+                for customer, folder in folders}
+
+    def has_topic(self, topic_name: str="", customer: str=None):
+        return topic_name in self._folder_of(topic_name, customer).registry
+
+    def get_topic_name(self, intent_label: str, customer: str=None) -> str:
+        """Get the longest topic name intent_label starts with, among the
+        topics of customer and the shared ones."""
+        topic_name = self._folder.registry.match(intent_label)
+        folder = self._customer_folder(customer)
+        if folder is not None:
+            name = folder.registry.match(intent_label)
+            if name and len(name) >= len(topic_name):
                 topic_name = name
-                match = score
         return topic_name
 
-    def create_topic(self, topic_name: str, id: str=None) -> Topic:
+    def update_topics(self, topics: Dict[str, Type[Topic]],
+                      customer: str=None):
+        """Add or replace topics, of customer or the shared ones, and swap
+        in the rebuilt index at once."""
+        folder = self._customer_folder(customer) or self._folder
+        folder.update_topics(topics)
+        self._clear_pools()
+
+    def remove_topics(self, topic_names: List[str], customer: str=None):
+        """Remove topics, of customer or the shared ones, and swap in the
+        rebuilt index at once."""
+        folder = self._customer_folder(customer) or self._folder
+        folder.remove_topics(topic_names)
+        self._clear_pools()
+
+    def reload(self) -> List[str]:
+        """Re-import the topic files added or modified since they were
+        loaded, drop the topics of the removed ones, and swap in the updated
+        registries at once. Only the changed files are imported, turns in
+        progress keep the topics they already created.
+
+        :return: paths of the changed files.
+        """
+        with self._customers_lock:
+            folders = [self._folder] + list(self._customers.values())
+        changed = []
+        for folder in folders:
+            changed += folder.reload()
+        if changed:
+            self._clear_pools()
+        return changed
+
+    def start_reloader(self, interval: float):
+        """Start a daemon thread calling reload() every interval seconds,
+        instead of the one started before if any."""
+        self.stop_reloader()
+        self._reloader = Reloader(self.reload, interval,
+                                  "TopicReloader").start()
+
+    def stop_reloader(self, timeout: float=None):
+        """Stop the thread started by start_reloader()."""
+        if self._reloader is not None:
+            self._reloader.stop(timeout)
+            self._reloader = None
+
+    def _pool(self) -> dict:
+        """Reused stateless topics of the current thread: topic class ->
+        instance."""
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            with self._pools_lock:
+                local.pool = dict()
+                local.generation = self._generation
+                self._pools[threading.current_thread()] = local.pool
+        return local.pool
+
+    def _clear_pools(self):
+        """Drop the reused stateless topics of every thread, so that no
+        unloaded or replaced topic class is kept alive by them."""
+        with self._pools_lock:
+            self._generation += 1
+            for pool in self._pools.values():
+                pool.clear()
+            self._pools.clear()
+
+    def create_topic(self, topic_name: str, id: str=None,
+                     customer: str=None) -> Topic:
         """Create specific sub-Topic instances according to topic names.
 
         :return: If parameter id is None, a completely empty instance without
             any conversation data will be returned. Otherwise, the returned
             instance will have previous conversation data restored from cache.
+            Stateless topics are reused per thread and keep their own id,
+            id is ignored for them.
         """
+        topic = self._folder_of(topic_name, customer).registry.get(topic_name)
+        if topic.stateless:
+            pool = self._pool()
+            instance = pool.get(topic)
+            if instance is None:
+                instance = pool[topic] = topic(None)
+            return instance
+
         if id:
-            return self._topics[topic_name](id)
+            return topic(id)
         else:
-            return self._topics[topic_name](None)
+            return topic(None)
@@ -3,6 +3,10 @@
 import os
 import re
 import json
+import uuid
+import asyncio
+import functools
+import itertools
 import importlib
 import importlib.util
 
@@ -88,6 +92,68 @@ class CustomJSONEncoder(json.JSONEncoder):
             return str(obj)
 
 
+_plain_types = (str, int, float, bool, type(None))
+
+
+def to_plain(obj):
+    """Convert obj to dict, list, str, int, float, bool and None only, the
+    way json.dumps with CustomJSONEncoder sees it."""
+    plain_types = _plain_types
+    if type(obj) in plain_types:
+        return obj
+    if isinstance(obj, dict):
+        # leaves are checked inline to save a call per plain value
+        return {k if type(k) is str else json.dumps(k):
+                v if type(v) in plain_types else to_plain(v)
+                for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [v if type(v) in plain_types else to_plain(v) for v in obj]
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    try:
+        value = obj.values
+    except Exception:
+        return str(obj)
+    return to_plain(value)
+
+
+async def call_async(func, *args, executor=None):
+    """Await func(*args) if it is a coroutine function, otherwise run it
+    in the executor (the default thread pool if executor is None)."""
+    if asyncio.iscoroutinefunction(func):
+        return await func(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+_id_prefix = ""
+_id_counter = None
+
+
+def _reset_ids():
+    """Draw a new random prefix and restart the counter. Also run in forked
+    children, which would otherwise repeat the ids of their parent."""
+    global _id_prefix, _id_counter
+    _id_prefix = uuid.uuid4().hex[:16] + "-"
+    _id_counter = itertools.count(1)
+
+
+_reset_ids()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_ids)
+
+
+def new_id() -> str:
+    """Id unique across processes and increasing within one: a random
+    prefix drawn per process followed by a counter, so unlike uuid.uuid1()
+    it needs neither a clock read nor a lock."""
+    return "%s%012x" % (_id_prefix, next(_id_counter))
+
+
 def singleton(cls, *args, **kwargs):
 
     instances = {}
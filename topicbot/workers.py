@@ -0,0 +1,194 @@
+"""Multi-process worker mode sharded by user"""
+
+import json
+import queue
+import logging
+import zlib
+import multiprocessing
+
+from typing import Callable, List
+
+from .bot import Bot
+from .response import Response, ResponseFactory
+
+
+_default_poll_interval = 0.05
+
+
+def _worker_main(bot_factory: Callable[[], Bot], inbox, outbox,
+                 poll_interval: float, initiative: bool):
+    """Loop of a worker process: respond to routed messages, and send the
+    due responses back to the front process."""
+    bot = bot_factory()
+    while True:
+        try:
+            msg = inbox.get(timeout=poll_interval)
+        except queue.Empty:
+            msg = {}
+
+        if msg is None:
+            break
+
+        if msg:
+            try:
+                bot.respond(msg)
+            except Exception:
+                logging.exception("Failed to respond to user %s",
+                                  msg.get("user"))
+
+        if initiative:
+            try:
+                users = bot.initiative_response_checking()
+                if users:
+                    bot.actively_respond_many(users)
+            except Exception:
+                logging.exception("Failed to actively respond to users")
+
+        try:
+            responses = bot.get_responses()
+        except Exception:
+            logging.exception("Failed to get the due responses")
+            continue
+        for response in responses:
+            try:
+                outbox.put(repr(response))
+            except Exception:
+                logging.exception("Failed to send a response of user %s",
+                                  getattr(response, "user", None))
+
+
+class BotPool:
+    """Route each message to one of N worker processes by its user.
+
+    Every worker builds its own Bot with bot_factory, so it owns its client
+    table and TopicFactory, and the turns of a user are always handled, in
+    order, by the same worker. Due responses are gathered back through a
+    queue per worker. Storage is whatever the configs set: InMemoryStorage is
+    then per worker, or a shared backend such as RedisStorage.
+
+    A worker found dead when a message is routed to it, or when responses
+    are collected, is restarted with a new inbox and outbox; the messages
+    queued to the dead one and the responses it did not hand over are lost.
+    A worker killed while writing cannot block the others this way, as it
+    would while holding the lock of a shared queue.
+    """
+
+    def __init__(self, bot_factory: Callable[[], Bot], workers: int=None,
+                 poll_interval: float=_default_poll_interval,
+                 initiative: bool=True, start_method: str=None):
+        """
+
+        Parameters
+        ----------
+        bot_factory: picklable callable, e.g. a module level function,
+            which creates the Bot of a worker process.
+        workers: number of worker processes, cpu count if None.
+        poll_interval: seconds a worker waits for a message before checking
+            its due responses.
+        initiative: whether workers check and actively respond to silent
+            users by themselves.
+        start_method: multiprocessing start method, platform default if None.
+        """
+        self._bot_factory = bot_factory
+        self._workers_num = workers or multiprocessing.cpu_count()
+        self._poll_interval = poll_interval
+        self._initiative = initiative
+        self._mp = multiprocessing.get_context(start_method)
+        self._inboxes = []
+        self._outboxes = []
+        self._processes = []
+        self._restarts = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def workers_num(self) -> int:
+        return self._workers_num
+
+    @property
+    def restarts(self) -> int:
+        """Number of dead workers restarted."""
+        return self._restarts
+
+    def start(self):
+        """Start the worker processes."""
+        if self._processes:
+            return
+        self._inboxes = [None] * self._workers_num
+        self._outboxes = [None] * self._workers_num
+        self._processes = [None] * self._workers_num
+        for index in range(self._workers_num):
+            self._start_worker(index)
+
+    def _start_worker(self, index: int):
+        inbox = self._mp.Queue()
+        outbox = self._mp.Queue()
+        process = self._mp.Process(
+            target=_worker_main,
+            args=(self._bot_factory, inbox, outbox,
+                  self._poll_interval, self._initiative),
+            daemon=True)
+        process.start()
+        self._inboxes[index] = inbox
+        self._outboxes[index] = outbox
+        self._processes[index] = process
+
+    def _check_worker(self, index: int):
+        """Restart the worker at index if it died."""
+        process = self._processes[index]
+        if process.is_alive():
+            return
+        logging.error("Worker %d died with exit code %s, restarting it",
+                      index, process.exitcode)
+        process.join()
+        self._inboxes[index].close()
+        self._outboxes[index].close()
+        self._start_worker(index)
+        self._restarts += 1
+
+    def check_workers(self):
+        """Restart the workers which died."""
+        for index in range(len(self._processes)):
+            self._check_worker(index)
+
+    def stop(self, timeout: float=None):
+        """Stop the worker processes after they handled queued messages."""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout)
+        self._inboxes = []
+        self._outboxes = []
+        self._processes = []
+
+    def worker_index(self, user: str) -> int:
+        """Index of the worker which handles user, stable across processes."""
+        return zlib.crc32(str(user).encode("utf-8")) % self._workers_num
+
+    def respond(self, msg: dict):
+        """Route msg to the worker of its user."""
+        index = self.worker_index(msg["user"])
+        self._check_worker(index)
+        self._inboxes[index].put(msg)
+
+    def get_responses(self) -> List[Response]:
+        """Collect the responses which workers found due."""
+        self.check_workers()
+        responses = []
+        for outbox in self._outboxes:
+            while True:
+                try:
+                    data = json.loads(outbox.get_nowait())
+                except queue.Empty:
+                    break
+                # keep the delay already waited for in the worker
+                if not data.get("delay"):
+                    data["no_delay"] = True
+                responses.append(ResponseFactory().create_response(
+                    data, data["msg_data"]))
+        return responses